@@ -1,63 +1,298 @@
+import types
+import typing
+from collections.abc import Mapping, Sequence
 from typing import Callable
 
 import sqlalchemy
 from pydantic import BaseModel
-from sqlmodel import Column, Field
+from sqlmodel import Column, Field, SQLModel
+
+from .binary import PydanticBinaryColumn
+from .cache import DecodeCache
+from .codec import Serialized, all_encoded, all_instances, container_adapter, digest
+from .lazy import LazyJSON, lazy_container
+from .mutable import MutablePydantic, listen_for_flushes, track, track_assignments
+from .trusted import construct, is_trusted
 
 JSONTypes = str | list[str] | dict[str, str] | tuple[str, ...] | None
 JSONTypesPydantic = BaseModel | list[BaseModel] | dict[str | int, BaseModel] | tuple[BaseModel, ...] | None
+# LazyJSON first, checking the others would load the proxy to read its __class__
+_PYDANTIC_VALUES = (LazyJSON, BaseModel, list, dict, tuple)
 
 
 class PydanticJSONColumn(sqlalchemy.TypeDecorator):
+    """
+    Store pydantic models (or list / dict / tuple of them) in a JSON column.
+
+    :param model_class: The pydantic model stored in the column.
+    :param native: Store models as real JSON objects (encoded once) instead of JSON strings inside JSON (encoded twice).
+        Native columns still read legacy double-encoded values, see :func:`pawsql.migrations.migrate_to_native`.
+    :param container: ``list``, ``dict`` or ``tuple`` if the column holds a container of models, None for one model.
+        Native columns need it to tell a dict of models from a single model, both being stored as JSON objects.
+        Set from the field annotation for SQLModel tables, see :func:`declared_container`.
+    :param lazy: Return a :class:`pawsql.lazy.LazyJSON` proxy from queries, validating the value on first access.
+    :param trusted: Build models read from the database without validating them, see :mod:`pawsql.trusted`.
+        Worth it for models with python validators, plain models validate faster in pydantic-core.
+    :param mutable: Return values that report in-place changes, see :mod:`pawsql.mutable`.
+        The column type must also be wrapped in ``MutablePydantic.as_mutable``, as done by :func:`pydantic_json_column`.
+    :param cache_size: Keep up to this many decoded values, keyed on the stored JSON,
+        see :class:`pawsql.cache.DecodeCache`. Hit and miss counts are available from
+        ``column_type.decode_cache.info()``.
+    """
     impl = sqlalchemy.JSON
+    cache_ok = True
 
-    def __init__(self, model_class: type[BaseModel], *args, **kwargs):
+    def __init__(
+            self,
+            model_class: type[BaseModel],
+            *args,
+            native: bool = False,
+            container: type[list | dict | tuple] | None = None,
+            lazy: bool = False,
+            trusted: bool = False,
+            mutable: bool = False,
+            cache_size: int = 0,
+            **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        if lazy and mutable:
+            raise ValueError('A column can not be both lazy and mutable')
+        if cache_size and (lazy or mutable):
+            raise ValueError('Lazy and mutable columns can not cache decoded values')
         self.model_class = model_class
+        self.native = native
+        self.container = container
+        self.lazy = lazy
+        self.trusted = trusted
+        self.mutable = mutable
+        if mutable:
+            listen_for_flushes()
+        self.cache_size = cache_size
+        self.decode_cache = DecodeCache(cache_size) if cache_size else None
+
+    def dump_item(self, item):
+        if type(item) is LazyJSON:
+            if not item.loaded:
+                return item.raw
+            item = item.value
+        if not isinstance(item, BaseModel):
+            return item
+        if self.native:
+            return item.model_dump(mode='json', round_trip=True)
+        return item.model_dump_json(round_trip=True)
+
+    def load_item(self, item) -> BaseModel:
+        if is_trusted(self.trusted):
+            return construct(self.model_class, item)
+        if isinstance(item, str | bytes):
+            return self.model_class.model_validate_json(item)
+        return self.model_class.model_validate(item)
+
+    def dump_container(self, value: list | dict | tuple, container: type) -> list | dict | tuple:
+        items = value.values() if container is dict else value
+        if not all_instances(items, self.model_class):
+            if container is dict:
+                return {key: self.dump_item(item) for key, item in value.items()}
+            return container(self.dump_item(item) for item in value)
+        adapter = container_adapter(self.model_class, container, encoded=not self.native)
+        if self.native:
+            return adapter.dump_python(value, mode='json', round_trip=True, warnings=False)
+        return adapter.dump_python(value, round_trip=True, warnings=False)
+
+    def load_container(self, value: list | dict | tuple, container: type) -> list | dict | tuple:
+        if is_trusted(self.trusted):
+            if container is dict:
+                return {key: construct(self.model_class, item) for key, item in value.items()}
+            return container(construct(self.model_class, item) for item in value)
+        encoded = all_encoded(value.values() if container is dict else value)
+        if encoded is None:
+            if container is dict:
+                return {key: self.load_item(item) for key, item in value.items()}
+            return container(self.load_item(item) for item in value)
+        return container_adapter(self.model_class, container, encoded=encoded).validate_python(value)
+
+    def process_bind_many(self, values: list[JSONTypesPydantic]) -> list[JSONTypes]:
+        """
+        Convert a batch of values for binding, a single TypeAdapter call if they are all models.
+        """
+        if values and all_instances(values, self.model_class):
+            adapter = container_adapter(self.model_class, list, encoded=not self.native)
+            if self.native:
+                return adapter.dump_python(values, mode='json', round_trip=True, warnings=False)
+            return adapter.dump_python(values, round_trip=True, warnings=False)
+        return [self.process_bind_param(_, None) for _ in values]
 
     def process_bind_param(self, value: JSONTypesPydantic, dialect) -> JSONTypes:
+        if type(value) is Serialized:
+            return value.value
+        if type(value) is LazyJSON:
+            if not value.loaded:
+                return value.raw
+            value = value.value
         if value is None:
             return None
         elif isinstance(value, list):
-            return [item.model_dump_json(round_trip=True) if isinstance(item, BaseModel) else item for item in value]
+            return self.dump_container(value, list)
         elif isinstance(value, dict):
-            return {
-                key: item.model_dump_json(round_trip=True) if isinstance(item, BaseModel) else item
-                for key, item in value.items()
-            }
+            return self.dump_container(value, dict)
         elif isinstance(value, tuple):
-            return tuple(
-                item.model_dump_json(round_trip=True) if isinstance(item, BaseModel) else item for item in value
-            )
+            return self.dump_container(value, tuple)
         elif isinstance(value, BaseModel):
-            return value.model_dump_json(round_trip=True)
+            return self.dump_item(value)
         # elif isinstance(value, date):
         #     logger.debug(f'Processing date {value}')
         #     return value.isoformat()
 
-    def process_result_value(self, value: JSONTypes, dialect) -> JSONTypesPydantic:
+    def result_processor(self, dialect, coltype):
+        process = super().result_processor(dialect, coltype)
+        cache = self.decode_cache
+        if cache is None:
+            return process
+
+        def process_cached(value):
+            if not isinstance(value, str | bytes):
+                return process(value)
+            return cache.get(value, lambda: process(value))
+
+        return process_cached
+
+    def process_result_value(self, value: JSONTypes, dialect) -> JSONTypesPydantic | LazyJSON:
+        if value is not None and self.lazy:
+            return self.lazy_value(value)
+        if value is not None and self.mutable:
+            return track(self.load_value(value), baseline=value)
+        return self.load_value(value)
+
+    def compare_values(self, x, y) -> bool:
+        """
+        Values are equal if they would be stored the same, so reassigning an equal value doesn't cause an UPDATE.
+        """
+        if x is y:
+            return True
+        if isinstance(x, _PYDANTIC_VALUES) and isinstance(y, _PYDANTIC_VALUES):
+            try:
+                return digest(self.process_bind_param(x, None)) == digest(self.process_bind_param(y, None))
+            except TypeError:
+                pass
+        return x == y
+
+    def load_value(self, value: JSONTypes) -> JSONTypesPydantic:
         if value is None:
             return None
         elif isinstance(value, list):
-            return [self.model_class.model_validate_json(item) for item in value]
-        elif isinstance(value, dict):
-            return {key: self.model_class.model_validate_json(item) for key, item in value.items()}
+            return self.load_container(value, list)
         elif isinstance(value, tuple):
-            return tuple(self.model_class.model_validate_json(item) for item in value)
-        return self.model_class.model_validate_json(value)
+            return self.load_container(value, tuple)
+        elif isinstance(value, dict) and self.stores_dict():
+            return self.load_container(value, dict)
+        return self.load_item(value)
+
+    def lazy_value(self, value: JSONTypes) -> LazyJSON | list[LazyJSON] | dict[str, LazyJSON]:
+        """
+        :return: A :class:`LazyJSON` proxy per model, in a real container for containers, see
+            :func:`pawsql.lazy.lazy_container`.
+        """
+        if isinstance(value, list | tuple):
+            return lazy_container(value, type(value), self.load_item)
+        if isinstance(value, dict) and self.stores_dict():
+            return lazy_container(value, dict, self.load_item)
+        return LazyJSON(value, self.load_item)
+
+    def stores_dict(self) -> bool:
+        """
+        :return: Whether a stored JSON object is a dict of models. Other columns store single models as JSON strings,
+            native ones store them as JSON objects too, so they go by the declared container.
+        """
+        return not self.native or self.container is dict
+
+
+def declared_container(annotation) -> type[list | dict | tuple] | None:
+    """
+    :param annotation: Field annotation, e.g. ``dict[str, Alert] | None``.
+    :return: The container it declares, ``list``, ``dict`` or ``tuple``, None for a single model.
+    """
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin in (typing.Union, types.UnionType):
+        containers = {declared_container(_) for _ in args if _ is not type(None)}
+        return containers.pop() if len(containers) == 1 else None
+    if origin is typing.Annotated:
+        return declared_container(args[0])
+    if isinstance(origin, type):
+        for container, abstract in ((tuple, tuple), (dict, Mapping), (list, Sequence)):
+            if issubclass(origin, abstract):
+                return container
+    return None
+
+
+@sqlalchemy.event.listens_for(SQLModel, 'after_mapper_constructed', propagate=True)
+def set_declared_containers(mapper, class_):
+    """
+    Give JSON columns of SQLModel tables the container of their field, unless they were given one.
+    """
+    fields = getattr(class_, 'model_fields', {})
+    for column in mapper.columns:
+        if isinstance(column.type, PydanticJSONColumn) and column.type.container is None and column.key in fields:
+            column.type.container = declared_container(fields[column.key].annotation)
+
+
+@sqlalchemy.event.listens_for(SQLModel, 'after_mapper_constructed', propagate=True)
+def track_mutable_assignments(mapper, class_):
+    """
+    Track changes to values assigned to mutable JSON columns, see :func:`pawsql.mutable.track_assignments`.
+    """
+    keys = [
+        column.key for column in mapper.local_table.columns
+        if isinstance(column.type, PydanticJSONColumn) and column.type.mutable
+    ]
+    track_assignments(class_, keys)
+
+
+def pydantic_json_column(model_class: type[BaseModel], **column_kwargs):
+    """
+    :param model_class: The pydantic model stored in the column.
+    :param column_kwargs: Options for :class:`PydanticJSONColumn`, e.g. ``native`` or ``lazy``.
+    """
+    column_type = PydanticJSONColumn(model_class, **column_kwargs)
+    if column_type.mutable:
+        column_type = MutablePydantic.as_mutable(column_type)
+    return Column(column_type)
+
+
+def required_json_field(model_class: type[BaseModel], **column_kwargs):
+    return Field(..., sa_column=pydantic_json_column(model_class, **column_kwargs))
+
+
+def optional_json_field(model_class: type[BaseModel], **column_kwargs):
+    return Field(None, sa_column=pydantic_json_column(model_class, **column_kwargs))
+
+
+def default_json_field(
+        model_class: type[BaseModel],
+        default_factory: Callable[[], JSONTypesPydantic],
+        **column_kwargs,
+):
+    return Field(default_factory=default_factory, sa_column=pydantic_json_column(model_class, **column_kwargs))
 
 
-def pydantic_json_column(model_class: type[BaseModel]):
-    return Column(PydanticJSONColumn(model_class))
+def pydantic_binary_column(model_class: type[BaseModel], **column_kwargs):
+    """
+    :param model_class: The pydantic model stored in the column.
+    :param column_kwargs: Options for :class:`PydanticBinaryColumn`, e.g. ``compression`` or ``compress_threshold``.
+    """
+    return Column(PydanticBinaryColumn(model_class, **column_kwargs))
 
 
-def required_json_field(model_class: type[BaseModel]):
-    return Field(..., sa_column=pydantic_json_column(model_class))
+def required_binary_field(model_class: type[BaseModel], **column_kwargs):
+    return Field(..., sa_column=pydantic_binary_column(model_class, **column_kwargs))
 
 
-def optional_json_field(model_class: type[BaseModel]):
-    return Field(None, sa_column=pydantic_json_column(model_class))
+def optional_binary_field(model_class: type[BaseModel], **column_kwargs):
+    return Field(None, sa_column=pydantic_binary_column(model_class, **column_kwargs))
 
 
-def default_json_field(model_class: type[BaseModel], default_factory: Callable[[], JSONTypesPydantic]):
-    return Field(default_factory=default_factory, sa_column=pydantic_json_column(model_class))
+def default_binary_field(
+        model_class: type[BaseModel],
+        default_factory: Callable[[], JSONTypesPydantic],
+        **column_kwargs,
+):
+    return Field(default_factory=default_factory, sa_column=pydantic_binary_column(model_class, **column_kwargs))
@@ -0,0 +1,181 @@
+"""
+Write backup files atomically, optionally compressed, ending in a trailer with their checksum and row counts,
+and read them back, checking the trailer
+"""
+from __future__ import annotations
+
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO, Literal
+
+from loguru import logger
+
+Compression = Literal['gzip', 'lzma']
+SUFFIXES = {None: '', 'gzip': '.gz', 'lzma': '.xz'}
+GZIP_MAGIC = b'\x1f\x8b'
+LZMA_MAGIC = b'\xfd7zXZ\x00'
+TRAILER_PREFIX = '{"pawsql_backup": '
+
+
+class BackupIntegrityError(ValueError):
+    """
+    A backup is incomplete, or its contents don't match its trailer.
+    """
+
+
+class ChecksumWriter:
+    """
+    Text file wrapper hashing everything written, see :func:`atomic_backup`.
+
+    :ivar rows: Number of records written per model, set by the writer, stored in the trailer.
+    """
+
+    def __init__(self, f: IO[str]):
+        self.f = f
+        self.digest = hashlib.sha256()
+        self.rows: dict[str, int] = {}
+
+    def write(self, text: str) -> int:
+        self.digest.update(text.encode())
+        return self.f.write(text)
+
+    def trailer(self) -> str:
+        return f'{TRAILER_PREFIX}1, "sha256": "{self.digest.hexdigest()}", "rows": {json.dumps(self.rows)}}}\n'
+
+
+@contextlib.contextmanager
+def atomic_path(target: Path) -> Iterator[Path]:
+    """
+    :returns: Temporary path next to ``target``. On success it is fsynced and renamed over ``target``, so readers
+        see the old file or the complete new one, never a partial write. On error it is deleted.
+    """
+    fd, temp = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.tmp')
+    os.close(fd)
+    temp = Path(temp)
+    try:
+        yield temp
+        fsync(temp)
+        os.replace(temp, target)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+    with contextlib.suppress(OSError):
+        fsync(target.parent)
+
+
+def fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_backup(target: Path, compression: Compression | None = None) -> Iterator[ChecksumWriter]:
+    """
+    Write a backup to ``target`` through :func:`atomic_path`, compressed as it is written, and append its trailer.
+
+    :param target: File to write.
+    :param compression: 'gzip', 'lzma' or None.
+    :returns: Writer to write the backup to, set its ``rows`` before exiting.
+    """
+    with atomic_path(target) as temp, open(temp, 'wb') as raw:
+        if compression == 'gzip':
+            stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+        elif compression == 'lzma':
+            stream = lzma.LZMAFile(raw, 'wb')
+        elif compression is None:
+            stream = raw
+        else:
+            raise ValueError(f'Unknown compression {compression!r}')
+        with io.TextIOWrapper(stream, encoding='utf-8', newline='') as f:
+            writer = ChecksumWriter(f)
+            yield writer
+            f.write(writer.trailer())
+
+
+def open_backup(path: Path) -> IO[str]:
+    """
+    :returns: Text file of the backup at ``path``, decompressed if it was written compressed.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(LZMA_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if magic.startswith(LZMA_MAGIC):
+        return lzma.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+class BackupReader:
+    """
+    Iterate over the lines of a backup, raising :class:`BackupIntegrityError` at the end if it doesn't match
+    its trailer.
+
+    :param path: Backup file, compressed or not.
+    :param verify: What to do with backups without a trailer, e.g. written before trailers existed: True to raise,
+        None to read them with a warning, False to read them silently. Backups with a trailer are always checked.
+    :ivar rows: Number of records per model according to the trailer, once read.
+    :ivar lines: Number of lines read, excluding the trailer.
+    """
+
+    def __init__(self, path: Path, verify: bool | None = None):
+        self.path = path
+        self.verify = verify
+        self.rows: dict[str, int] | None = None
+        self.lines = 0
+
+    def __iter__(self) -> Iterator[str]:
+        digest = hashlib.sha256()
+        trailer = None
+        self.lines = 0
+        with open_backup(self.path) as f:
+            for line in f:
+                if line.startswith(TRAILER_PREFIX):
+                    trailer = json.loads(line)
+                    break
+                digest.update(line.encode())
+                self.lines += 1
+                yield line
+
+        if trailer is None:
+            if self.verify:
+                raise BackupIntegrityError(f'{self.path} has no trailer, it is incomplete or predates checksums')
+            if self.verify is None:
+                logger.warning(f'{self.path} has no checksum trailer, reading it unchecked', category='BACKUP')
+            return
+        if trailer['sha256'] != digest.hexdigest():
+            raise BackupIntegrityError(f'{self.path} does not match its checksum')
+        self.rows = trailer['rows']
+
+    def check(self, line_per_row: bool = True) -> BackupReader:
+        """
+        Read the whole backup to check it, without keeping its contents.
+
+        :param line_per_row: The backup holds one line per record, check the line count against the trailer.
+        """
+        for _ in self:
+            pass
+        if line_per_row and self.rows is not None and self.lines != sum(self.rows.values()):
+            expected = sum(self.rows.values())
+            raise BackupIntegrityError(f'{self.path} has {self.lines} records, its trailer says {expected}')
+        return self
+
+    def check_rows(self, counts: dict[str, int]):
+        """
+        :param counts: Number of records read per model.
+        """
+        if self.rows is None:
+            return
+        expected = {key: count for key, count in self.rows.items() if count}
+        if {key: count for key, count in counts.items() if count} != expected:
+            raise BackupIntegrityError(f'{self.path} row counts {counts} do not match its trailer {expected}')
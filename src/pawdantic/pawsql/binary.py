@@ -0,0 +1,182 @@
+"""
+Store pydantic models as compact, optionally compressed, binary
+"""
+from __future__ import annotations
+
+import json
+import lzma
+import zlib
+from typing import Literal
+
+import sqlalchemy
+from pydantic import BaseModel
+
+from .codec import Serialized, all_instances, container_adapter
+from .lazy import LazyJSON, lazy_container
+from .trusted import construct, is_trusted
+
+MAGIC = b'PW'
+VERSION = 1
+HEADER_SIZE = 5
+
+CODECS = {'none': 0, 'zlib': 1, 'lzma': 2}
+SHAPES = {BaseModel: b'm', list: b'l', dict: b'd', tuple: b't'}
+CONTAINERS = {v: k for k, v in SHAPES.items()}
+
+Compression = Literal['zlib', 'lzma']
+
+
+def compress(payload: bytes, codec: int, level: int | None) -> bytes:
+    if codec == CODECS['zlib']:
+        return zlib.compress(payload, -1 if level is None else level)
+    elif codec == CODECS['lzma']:
+        return lzma.compress(payload, preset=level)
+    return payload
+
+
+def decompress(payload: bytes, codec: int) -> bytes:
+    if codec == CODECS['zlib']:
+        return zlib.decompress(payload)
+    elif codec == CODECS['lzma']:
+        return lzma.decompress(payload)
+    elif codec == CODECS['none']:
+        return payload
+    raise ValueError(f'Unknown compression codec {codec}')
+
+
+def read_header(data: bytes) -> tuple[int, bytes]:
+    """
+    Values start with ``MAGIC``, a format version byte, a compression codec byte and a shape byte.
+
+    :return: The compression codec and shape of a stored value.
+    """
+    if len(data) < HEADER_SIZE or data[:2] != MAGIC:
+        raise ValueError('Not a pawsql binary value')
+    if data[2] != VERSION:
+        raise ValueError(f'Unsupported pawsql binary format version {data[2]}')
+    return data[3], data[4:5]
+
+
+def dump_items(value: list | dict | tuple, container: type) -> list | dict:
+    def dump(item):
+        if type(item) is LazyJSON:
+            if not item.loaded:
+                return item.raw
+            item = item.value
+        return item.model_dump(mode='json', round_trip=True) if isinstance(item, BaseModel) else item
+
+    if container is dict:
+        return {key: dump(item) for key, item in value.items()}
+    return [dump(item) for item in value]
+
+
+class PydanticBinaryColumn(sqlalchemy.TypeDecorator):
+    """
+    Store pydantic models (or list / dict / tuple of them) as JSON bytes in a binary column.
+
+    Values larger than ``compress_threshold`` bytes are compressed. Every value carries a small header recording
+    format version, compression and container shape, so tuples round-trip and codecs can change later.
+
+    :param model_class: The pydantic model stored in the column.
+    :param compression: Standard library codec used for large values.
+    :param compress_threshold: Minimum serialized size in bytes to compress.
+    :param level: Compression level (zlib) or preset (lzma), None for the codec's default.
+    :param lazy: Return a :class:`pawsql.lazy.LazyJSON` proxy from queries, validating the value on first access.
+        Containers are decompressed and parsed when read, and hold a proxy per model.
+    :param trusted: Build models read from the database without validating them, see :mod:`pawsql.trusted`.
+    """
+    impl = sqlalchemy.LargeBinary
+    cache_ok = True
+
+    def __init__(
+            self,
+            model_class: type[BaseModel],
+            *args,
+            compression: Compression = 'zlib',
+            compress_threshold: int = 512,
+            level: int | None = None,
+            lazy: bool = False,
+            trusted: bool = False,
+            **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if compression not in CODECS:
+            raise ValueError(f'Unknown compression {compression}, expected one of {list(CODECS)}')
+        self.model_class = model_class
+        self.compression = compression
+        self.codec = CODECS[compression]
+        self.compress_threshold = compress_threshold
+        self.level = level
+        self.lazy = lazy
+        self.trusted = trusted
+
+    def encode(self, value) -> bytes:
+        if isinstance(value, BaseModel):
+            container = BaseModel
+            payload = value.__pydantic_serializer__.to_json(value, round_trip=True)
+        else:
+            container = next((_ for _ in (list, dict, tuple) if isinstance(value, _)), None)
+            if container is None:
+                raise TypeError(f'Unsupported type {type(value)}')
+            items = value.values() if container is dict else value
+            if all_instances(items, self.model_class):
+                payload = container_adapter(self.model_class, container).dump_json(value, round_trip=True)
+            else:
+                payload = json.dumps(dump_items(value, container), separators=(',', ':')).encode()
+
+        codec = self.codec if len(payload) >= self.compress_threshold else CODECS['none']
+        return MAGIC + bytes((VERSION, codec)) + SHAPES[container] + compress(payload, codec, self.level)
+
+    def decode(self, data: bytes):
+        codec, shape = read_header(data)
+        payload = decompress(data[HEADER_SIZE:], codec)
+        container = CONTAINERS[shape]
+
+        if is_trusted(self.trusted):
+            loaded = json.loads(payload)
+            if container is BaseModel:
+                return construct(self.model_class, loaded)
+            elif container is dict:
+                return {key: construct(self.model_class, item) for key, item in loaded.items()}
+            return container(construct(self.model_class, item) for item in loaded)
+
+        if container is BaseModel:
+            return self.model_class.model_validate_json(payload)
+        return container_adapter(self.model_class, container).validate_json(payload)
+
+    def load_item(self, item: dict) -> BaseModel:
+        if is_trusted(self.trusted):
+            return construct(self.model_class, item)
+        return self.model_class.model_validate(item)
+
+    def lazy_value(self, data: bytes) -> LazyJSON | list[LazyJSON] | dict[str, LazyJSON]:
+        """
+        :return: A :class:`LazyJSON` proxy per model, in a real container if the stored shape is one,
+            see :func:`pawsql.lazy.lazy_container`.
+        """
+        codec, shape = read_header(data)
+        container = CONTAINERS[shape]
+        if container is BaseModel:
+            return LazyJSON(data, self.decode)
+        return lazy_container(json.loads(decompress(data[HEADER_SIZE:], codec)), container, self.load_item)
+
+    def process_bind_many(self, values: list) -> list[bytes | None]:
+        return [self.process_bind_param(_, None) for _ in values]
+
+    def process_bind_param(self, value, dialect) -> bytes | None:
+        if type(value) is Serialized:
+            return value.value
+        if type(value) is LazyJSON:
+            if not value.loaded:
+                return value.raw
+            value = value.value
+        if value is None:
+            return None
+        return self.encode(value)
+
+    def process_result_value(self, value: bytes | None, dialect):
+        if value is None:
+            return None
+        if self.lazy:
+            return self.lazy_value(bytes(value))
+        return self.decode(bytes(value))
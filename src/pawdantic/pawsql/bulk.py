@@ -0,0 +1,195 @@
+"""
+Bulk insert / upsert SQLModel rows without the ORM unit of work
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from itertools import islice
+from typing import Literal
+
+import sqlalchemy as sqa
+from loguru import logger
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlmodel import SQLModel, Session
+
+from .codec import Serialized
+
+OnConflict = Literal['error', 'ignore', 'update']
+
+
+def batches(items: Iterable, size: int) -> Iterable[list]:
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def row_values(row: SQLModel | dict, columns: Sequence[sqa.Column]) -> dict:
+    """
+    :return: Values for ``columns``, omitting primary keys that are None so the database generates them.
+    """
+    get = row.get if isinstance(row, dict) else lambda key, default: getattr(row, key, default)
+    values = {}
+    for column in columns:
+        value = get(column.key, None)
+        if value is None and (column.primary_key or column.default is not None or column.server_default is not None):
+            continue
+        values[column.key] = value
+    return values
+
+
+def serialize_batch(batch: list[dict], columns: Sequence[sqa.Column]) -> None:
+    """
+    Convert the values of every column with a ``process_bind_many`` codec, one call per column for the whole batch.
+    """
+    for column in columns:
+        bind_many = getattr(column.type, 'process_bind_many', None)
+        if bind_many is None:
+            continue
+        rows = [_ for _ in batch if column.key in _]
+        for row, value in zip(rows, bind_many([_[column.key] for _ in rows])):
+            row[column.key] = Serialized(value)
+
+
+def insert_statement(
+        table: sqa.Table,
+        dialect: sqa.Dialect,
+        on_conflict: OnConflict,
+        conflict_columns: Sequence[str],
+        update_columns: Sequence[str],
+):
+    if on_conflict == 'error':
+        return sqa.insert(table)
+
+    if dialect.name in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect.name == 'sqlite' else postgresql).insert(table)
+        if on_conflict == 'ignore' or not update_columns:
+            return insert.on_conflict_do_nothing(index_elements=conflict_columns)
+        return insert.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={_: insert.excluded[_] for _ in update_columns},
+        )
+    elif dialect.name in ('mysql', 'mariadb'):
+        insert = mysql.insert(table)
+        if on_conflict == 'ignore' or not update_columns:
+            return insert.prefix_with('IGNORE')
+        return insert.on_duplicate_key_update({_: insert.inserted[_] for _ in update_columns})
+    raise NotImplementedError(f'on_conflict={on_conflict!r} is not supported for {dialect.name}')
+
+
+def bulk_insert(
+        session: Session,
+        model_class: type[SQLModel],
+        rows: Iterable[SQLModel | dict],
+        batch_size: int = 1000,
+        on_conflict: OnConflict = 'error',
+        conflict_columns: Sequence[str] | None = None,
+        commit: bool = False,
+        return_keys: bool = True,
+) -> list:
+    """
+    Insert rows with chunked ``executemany`` statements, bypassing the ORM.
+
+    JSON / binary model columns are serialized for a whole batch at once by their column codec.
+    Rows are not added to the session, and ORM events are not fired.
+
+    :param session: Session to execute in.
+    :param model_class: SQLModel table class to insert into.
+    :param rows: Model instances or dicts of column values.
+    :param batch_size: Rows per statement.
+    :param on_conflict: 'error' to raise, 'ignore' to skip conflicting rows, 'update' to overwrite them.
+    :param conflict_columns: Columns of the unique constraint to check, defaults to the primary key.
+    :param commit: Commit after every batch, rather than leaving the transaction to the caller.
+    :param return_keys: Return the primary keys of the rows, set False to insert without RETURNING.
+    :return: Primary keys of inserted (or updated) rows, or tuples of them for composite keys, in no particular
+        order: asking for parameter order makes some drivers, e.g. SQLite, insert one row per statement.
+        Empty if the database can't return them from ``executemany``, or ``return_keys`` is False.
+    """
+    table: sqa.Table = model_class.__table__
+    dialect = session.get_bind().dialect
+    columns = list(table.columns)
+    pk = list(table.primary_key.columns)
+    conflict_columns = list(conflict_columns or [_.name for _ in pk])
+    update_columns = [_.name for _ in columns if _.name not in conflict_columns]
+    statement = insert_statement(table, dialect, on_conflict, conflict_columns, update_columns)
+
+    returning = return_keys and bool(pk) and dialect.insert_executemany_returning
+    if returning:
+        statement = statement.returning(*pk)
+    elif return_keys and pk:
+        logger.debug(f'{dialect.name} can not return primary keys from executemany')
+
+    keys = []
+    count = 0
+    for batch in batches(rows, batch_size):
+        values = [row_values(_, columns) for _ in batch]
+        serialize_batch(values, columns)
+        # executemany needs the same keys in every row, so group rows that omit generated values
+        groups: dict[tuple, list[dict]] = {}
+        for row in values:
+            groups.setdefault(tuple(row), []).append(row)
+        for group in groups.values():
+            result = session.execute(statement, group)
+            if returning:
+                keys.extend(_[0] if len(pk) == 1 else tuple(_) for _ in result)
+        count += len(batch)
+        if commit:
+            session.commit()
+
+    logger.debug(f'Bulk inserted {count} {model_class.__name__} rows')
+    return keys
+
+
+def bulk_update(
+        session: Session,
+        model_class: type[SQLModel],
+        rows: Iterable[SQLModel | dict],
+        batch_size: int = 1000,
+        skip_none: bool = False,
+        commit: bool = False,
+) -> int:
+    """
+    Update rows by primary key with chunked ``executemany`` statements, bypassing the ORM.
+
+    :param session: Session to execute in.
+    :param model_class: SQLModel table class to update.
+    :param rows: Model instances or dicts of column values, including the primary key.
+    :param batch_size: Rows per statement.
+    :param skip_none: Leave columns whose new value is None unchanged, rather than setting them to NULL.
+    :param commit: Commit after every batch, rather than leaving the transaction to the caller.
+    :return: Number of rows given.
+    """
+    table: sqa.Table = model_class.__table__
+    pk = list(table.primary_key.columns)
+    columns = [_ for _ in table.columns if not _.primary_key]
+    statements = {}
+    count = 0
+
+    for batch in batches(rows, batch_size):
+        values = [row_values(_, pk) | full_row_values(_, columns, skip_none) for _ in batch]
+        serialize_batch(values, columns)
+        groups: dict[tuple, list[dict]] = {}
+        for row in values:
+            groups.setdefault(tuple(row), []).append({f'_{key}': value for key, value in row.items()})
+        for keys, group in groups.items():
+            if keys not in statements:
+                statements[keys] = (
+                    sqa.update(table)
+                    .where(*[_ == sqa.bindparam(f'_{_.key}', type_=_.type) for _ in pk])
+                    .values({_.key: sqa.bindparam(f'_{_.key}', type_=_.type) for _ in columns if _.key in keys})
+                )
+            session.execute(statements[keys], group)
+        count += len(batch)
+        if commit:
+            session.commit()
+
+    logger.debug(f'Bulk updated {count} {model_class.__name__} rows')
+    return count
+
+
+def full_row_values(row: SQLModel | dict, columns: Sequence[sqa.Column], skip_none: bool = False) -> dict:
+    """
+    :return: Values for ``columns``, including None values unless ``skip_none``.
+    """
+    get = row.get if isinstance(row, dict) else lambda key, default: getattr(row, key, default)
+    values = {_.key: get(_.key, None) for _ in columns}
+    return {key: value for key, value in values.items() if value is not None} if skip_none else values
@@ -0,0 +1,115 @@
+"""
+Bounded cache of decoded column values, keyed on the stored JSON
+"""
+from __future__ import annotations
+
+import datetime
+import threading
+import types
+import typing as _t
+from collections import OrderedDict
+from enum import Enum
+from functools import cache
+
+from pydantic import BaseModel
+
+
+class CacheInfo(_t.NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+_MISSING = object()
+_IMMUTABLE = (str, int, float, bool, bytes, type(None), Enum, datetime.date, datetime.time, datetime.timedelta)
+
+
+class DecodeCache:
+    """
+    Least-recently-used cache of decoded values, returning a copy on every hit so callers can't change cached values.
+    Models whose fields are all immutable are copied shallowly, frozen ones not at all.
+
+    :param maxsize: Maximum number of values to keep.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str | bytes, load: _t.Callable[[], _t.Any]):
+        """
+        :param key: The stored value.
+        :param load: Callable decoding ``key``, called on a miss.
+        :return: A copy of the decoded value.
+        """
+        with self._lock:
+            value = self._values.get(key, _MISSING)
+            if value is not _MISSING:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return fresh(value)
+            self.misses += 1
+
+        value = load()
+        with self._lock:
+            self._values[key] = value
+            if len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+        return fresh(value)
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._values))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self.hits = self.misses = 0
+
+
+def fresh(value):
+    """
+    :return: A copy of a cached model (or list / dict / tuple of models) that can be changed without touching ``value``.
+    """
+    if isinstance(value, BaseModel):
+        copy_mode = model_copy_mode(type(value))
+        if copy_mode == 'none':
+            return value
+        return value.model_copy(deep=copy_mode == 'deep')
+    elif isinstance(value, list):
+        return [fresh(_) for _ in value]
+    elif isinstance(value, tuple):
+        return tuple(fresh(_) for _ in value)
+    elif isinstance(value, dict):
+        return {key: fresh(_) for key, _ in value.items()}
+    return value
+
+
+@cache
+def model_copy_mode(model_class: type[BaseModel]) -> _t.Literal['none', 'shallow', 'deep']:
+    """
+    :return: 'none' if instances can be shared, 'shallow' if a copy can share field values, else 'deep'.
+    """
+    immutable_fields = all(is_immutable(_.annotation) for _ in model_class.model_fields.values())
+    if not immutable_fields:
+        return 'deep'
+    if model_class.model_config.get('frozen') and not model_class.__private_attributes__:
+        return 'none'
+    return 'shallow'
+
+
+def is_immutable(annotation) -> bool:
+    origin = _t.get_origin(annotation)
+    args = _t.get_args(annotation)
+    if origin is _t.Literal:
+        return True
+    elif origin is _t.Annotated:
+        return is_immutable(args[0])
+    elif origin in (_t.Union, types.UnionType, tuple, frozenset):
+        return all(is_immutable(_) for _ in args if _ is not Ellipsis)
+    elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return model_copy_mode(annotation) == 'none'
+    return isinstance(annotation, type) and issubclass(annotation, _IMMUTABLE)
@@ -0,0 +1,72 @@
+"""
+Cached pydantic TypeAdapters to validate and dump whole containers of models in one call
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from functools import cache
+
+from pydantic import BaseModel, Json, TypeAdapter
+
+CONTAINERS = (list, dict, tuple)
+
+#: Subclasses that add no fields and dump exactly like their model, e.g. :func:`pawsql.mutable.tracked_model`.
+SAME_AS: dict[type[BaseModel], type[BaseModel]] = {}
+
+
+@cache
+def container_adapter(model_class: type[BaseModel], container: type, encoded: bool = False) -> TypeAdapter:
+    """
+    Build a TypeAdapter for ``list[model_class]``, ``dict[str, model_class]`` or ``tuple[model_class, ...]``.
+
+    :param model_class: The pydantic model held in the container.
+    :param container: One of ``list``, ``dict`` or ``tuple``.
+    :param encoded: Items are JSON strings (``Json[model_class]``) rather than python objects.
+    :return: A TypeAdapter, built once per arguments.
+    """
+    item = Json[model_class] if encoded else model_class
+    if container is list:
+        return TypeAdapter(list[item])
+    elif container is dict:
+        return TypeAdapter(dict[str, item])
+    elif container is tuple:
+        return TypeAdapter(tuple[item, ...])
+    raise TypeError(f'Unsupported container {container}, expected one of {CONTAINERS}')
+
+
+def all_instances(items, model_class: type[BaseModel]) -> bool:
+    """
+    :return: True if every item is exactly ``model_class`` (not a subclass, which an adapter would dump as its parent).
+    """
+    return all(type(_) is model_class or SAME_AS.get(type(_)) is model_class for _ in items)
+
+
+def all_encoded(items) -> bool | None:
+    """
+    :return: True if every item is a JSON string, False if none are, None if mixed.
+    """
+    encoded = [isinstance(_, str | bytes) for _ in items]
+    if all(encoded):
+        return True
+    elif not any(encoded):
+        return False
+    return None
+
+
+def digest(value) -> bytes:
+    """
+    :param value: A value as produced by a column's ``process_bind_param``.
+    :return: A short hash of the value's JSON form, equal for values that would be stored identically.
+    """
+    return hashlib.blake2b(json.dumps(value, separators=(',', ':')).encode(), digest_size=16).digest()
+
+
+class Serialized:
+    """
+    A column value already converted by the column's ``process_bind_many``, passed through ``process_bind_param``.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
@@ -0,0 +1,270 @@
+"""
+Deduplicated backups: every distinct row is stored once, snapshots are lists of row hashes
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import NamedTuple
+
+from loguru import logger
+from pydantic import BaseModel
+from sqlmodel import SQLModel, Session
+
+from .backup_file import BackupIntegrityError, atomic_path
+from .restore import Conflict, restore_records
+from .sqlmodel_backup import SQLModelBackup
+
+
+class BlobRef(NamedTuple):
+    pack: str
+    offset: int
+    length: int
+
+
+class Snapshot(BaseModel):
+    """
+    One backup: the hash of every row per model, in the order they were read.
+    """
+    name: str
+    created: datetime
+    models: dict[str, list[str]] = {}
+
+
+class DedupBackup(SQLModelBackup):
+    """
+    Back-up a SQLModel database Session() to a content-addressed store, so unchanged rows cost nothing to keep.
+
+    Each row's JSON is hashed, rows not already in the store are appended to a new pack file, and the snapshot is
+    a manifest of hashes per model. Pruning deletes old manifests, then garbage-collects packs: packs with no live
+    rows are deleted, and packs mostly made of dead rows are rewritten with only the live ones.
+
+    Store layout in ``output_dir / 'dedup'``: ``packs/<name>.pack`` of row JSON lines, ``packs/<name>.idx`` mapping
+    row hash to offset and length in the pack, and ``snapshots/<name>.json`` per backup.
+
+    :param session: SQLModel session for database operations.
+    :param models: List of SQLModel classes to backup.
+    :param output_dir: Directory to keep the store in.
+    :param chunk_size: Number of rows to fetch from the database at once.
+    :param repack_below: Rewrite packs whose share of live rows falls below this during garbage collection.
+    """
+
+    def __init__(
+            self,
+            session: Session,
+            models: list[type(SQLModel)],
+            output_dir: Path,
+            chunk_size: int = 1000,
+            repack_below: float = 0.5,
+    ):
+        super().__init__(session, models, output_dir, chunk_size=chunk_size)
+        self.repack_below = repack_below
+        self.store_dir = self.output_dir / 'dedup'
+        self.packs_dir = self.store_dir / 'packs'
+        self.snapshots_dir = self.store_dir / 'snapshots'
+        self.packs_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        self.last_written = 0
+
+    def load_index(self) -> dict[str, BlobRef]:
+        """
+        :returns: Dictionary: {row hash : where the row is stored}, for every pack in the store.
+        """
+        index = {}
+        for idx_path in sorted(self.packs_dir.glob('*.idx')):
+            pack = idx_path.stem
+            index.update((digest, BlobRef(pack, *ref)) for digest, ref in json.loads(idx_path.read_text()).items())
+        return index
+
+    def snapshots(self) -> list[Snapshot]:
+        """
+        :returns: Every snapshot in the store, oldest first.
+        """
+        return [Snapshot.model_validate_json(_.read_text()) for _ in sorted(self.snapshots_dir.glob('*.json'))]
+
+    def next_name(self) -> str:
+        names = [_.stem for _ in self.snapshots_dir.glob('*.json')] + [_.stem for _ in self.packs_dir.glob('*.pack')]
+        return f'{max((int(_) for _ in names), default=0) + 1:08}'
+
+    def backup(self) -> dict[str, int]:
+        """
+        Add a snapshot of ``self.session`` to the store, writing only rows the store doesn't hold yet.
+
+        :returns: Dictionary: {model.__name__ : number of records in the snapshot}.
+        """
+        index = self.load_index()
+        name = self.next_name()
+        snapshot = Snapshot(name=name, created=datetime.now())
+        new_refs = {}
+        pack_path = self.packs_dir / f'{name}.pack'
+        with atomic_path(pack_path) as temp, open(temp, 'wb') as pack:
+            for json_key, model_class in self.json_key_to_model_map.items():
+                hashes = snapshot.models[json_key] = []
+                for record in self.iter_model_json(model_class):
+                    blob = record.encode()
+                    digest = row_digest(blob)
+                    hashes.append(digest)
+                    if digest not in index and digest not in new_refs:
+                        new_refs[digest] = (pack.tell(), len(blob))
+                        pack.write(blob + b'\n')
+
+        self.last_written = 0
+        if new_refs:
+            self.write_index(name, new_refs)
+            self.last_written += pack_path.stat().st_size
+        else:
+            pack_path.unlink()
+        snapshot_path = self.snapshots_dir / f'{name}.json'
+        with atomic_path(snapshot_path) as temp:
+            temp.write_text(snapshot.model_dump_json())
+        self.last_written += snapshot_path.stat().st_size
+
+        counts = {json_key: len(hashes) for json_key, hashes in snapshot.models.items()}
+        logger.info(
+            f'Saved snapshot {name} of {sum(counts.values())} rows, {len(new_refs)} of them new', category='BACKUP'
+        )
+        return counts
+
+    def write_index(self, pack: str, refs: dict[str, tuple[int, int]]):
+        with atomic_path(self.packs_dir / f'{pack}.idx') as temp:
+            temp.write_text(json.dumps(refs))
+
+    def written_size(self, counts: dict[str, int]) -> int:
+        return self.last_written
+
+    def iter_snapshot(self, snapshot: Snapshot, json_key: str, index: dict[str, BlobRef]) -> Iterator[str]:
+        """
+        :returns: JSON string of every row of ``json_key`` in ``snapshot``, checked against its hash.
+        :raises BackupIntegrityError: If a row is missing from the store or doesn't match its hash.
+        """
+        packs = {}
+        try:
+            for digest in snapshot.models.get(json_key, []):
+                ref = index.get(digest)
+                if ref is None:
+                    raise BackupIntegrityError(f'Row {digest} of snapshot {snapshot.name} is missing from the store')
+                if ref.pack not in packs:
+                    with open(self.packs_dir / f'{ref.pack}.pack', 'rb') as f:
+                        packs[ref.pack] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                blob = packs[ref.pack][ref.offset:ref.offset + ref.length]
+                if row_digest(blob) != digest:
+                    raise BackupIntegrityError(f'Row {digest} in pack {ref.pack} does not match its hash')
+                yield blob.decode()
+        finally:
+            for mm in packs.values():
+                mm.close()
+
+    def restore(self, conflict: Conflict = 'skip', batch_size: int = 1000, name: str | None = None):
+        """
+        Restore database from a snapshot in the store. Rows are read and checked before the session is touched.
+
+        :param conflict: What to do with records already in the database: 'skip', 'overwrite' or 'merge'.
+        :param batch_size: Number of records per batch.
+        :param name: Snapshot to restore, defaults to the latest.
+        """
+        snapshots = {_.name: _ for _ in self.snapshots()}
+        if not snapshots:
+            logger.error(f'No snapshots found in {self.store_dir}')
+            return
+        snapshot = snapshots[name or max(snapshots)]
+        index = self.load_index()
+        try:
+            records = {json_key: list(self.iter_snapshot(snapshot, json_key, index)) for json_key in snapshot.models}
+        except Exception as e:
+            logger.error(f'Error loading snapshot {snapshot.name}: {e}')
+            return
+
+        for json_key, model_class in self.json_key_to_model_map.items():
+            counts = restore_records(self.session, model_class, records.get(json_key, []), conflict, batch_size)
+            if counts.added or counts.updated:
+                logger.info(
+                    f'Loaded {counts.added} and updated {counts.updated} {json_key} from snapshot {snapshot.name}',
+                    category='BACKUP'
+                )
+        self.session.commit()
+
+    def prune(self, keep: int | None = None, keep_for: timedelta | None = None) -> int:
+        """
+        Delete snapshots beyond the retention limits, the latest is always kept, then :meth:`collect_garbage`.
+
+        :param keep: Number of most recent snapshots to keep.
+        :param keep_for: Keep snapshots younger than this.
+        :returns: Number of bytes freed.
+        """
+        snapshots = self.snapshots()
+        now = datetime.now()
+        for position, snapshot in enumerate(reversed(snapshots)):
+            if position == 0:
+                continue
+            if (keep is not None and position >= keep) or (keep_for is not None and now - snapshot.created > keep_for):
+                (self.snapshots_dir / f'{snapshot.name}.json').unlink()
+                logger.debug(f'Pruned snapshot {snapshot.name}')
+        return self.collect_garbage()
+
+    def collect_garbage(self) -> int:
+        """
+        Delete packs no snapshot refers to, and packs left without an index by a crash, and rewrite packs below
+        ``self.repack_below`` live rows. Don't run it while a backup is being written.
+
+        :returns: Number of bytes freed.
+        """
+        live = {digest for snapshot in self.snapshots() for hashes in snapshot.models.values() for digest in hashes}
+        by_pack: dict[str, dict[str, BlobRef]] = {}
+        for digest, ref in self.load_index().items():
+            by_pack.setdefault(ref.pack, {})[digest] = ref
+
+        freed = 0
+        for pack_path in self.packs_dir.glob('*.pack'):
+            if not pack_path.with_suffix('.idx').exists():
+                freed += pack_path.stat().st_size
+                pack_path.unlink()
+                logger.debug(f'Deleted pack {pack_path.stem}, it has no index')
+        for pack, refs in by_pack.items():
+            live_refs = {digest: ref for digest, ref in refs.items() if digest in live}
+            pack_path = self.packs_dir / f'{pack}.pack'
+            size = pack_path.stat().st_size
+            if not live_refs:
+                self.delete_pack(pack)
+                freed += size
+            elif len(live_refs) < len(refs) * self.repack_below:
+                new_pack = self.repack(pack, live_refs)
+                freed += size - (self.packs_dir / f'{new_pack}.pack').stat().st_size
+        if freed:
+            logger.info(f'Freed {freed} bytes from {self.store_dir}', category='BACKUP')
+        return freed
+
+    def delete_pack(self, pack: str):
+        (self.packs_dir / f'{pack}.idx').unlink()
+        (self.packs_dir / f'{pack}.pack').unlink()
+        logger.debug(f'Deleted pack {pack}')
+
+    def repack(self, pack: str, refs: dict[str, BlobRef]) -> str:
+        """
+        Copy the rows in ``refs`` to a new pack and index, then delete ``pack``.
+
+        Snapshots refer to rows by hash, and :meth:`load_index` reads newer indexes last, so the new pack takes over
+        as soon as its index is written. A crash at any point leaves every row readable at its recorded offset:
+        before the new index exists its pack is an orphan, after it the old pack is a duplicate, and both are
+        removed by the next :meth:`collect_garbage`.
+
+        :returns: Name of the new pack.
+        """
+        new_pack = self.next_name()
+        new_refs = {}
+        with open(self.packs_dir / f'{pack}.pack', 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with atomic_path(self.packs_dir / f'{new_pack}.pack') as temp, open(temp, 'wb') as out:
+                for digest, ref in sorted(refs.items(), key=lambda _: _[1].offset):
+                    new_refs[digest] = (out.tell(), ref.length)
+                    out.write(mm[ref.offset:ref.offset + ref.length] + b'\n')
+        self.write_index(new_pack, new_refs)
+        self.delete_pack(pack)
+        logger.debug(f'Repacked {pack} to {new_pack} with {len(refs)} rows')
+        return new_pack
+
+
+def row_digest(blob: bytes) -> str:
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
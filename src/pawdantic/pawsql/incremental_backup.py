@@ -0,0 +1,222 @@
+"""
+Incremental backups: a full snapshot followed by delta files holding only the rows added or changed since the last run
+"""
+from __future__ import annotations
+
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Any
+
+import sqlalchemy as sqa
+from loguru import logger
+from pydantic import BaseModel, TypeAdapter
+from sqlmodel import SQLModel, Session, select
+
+from .backup_file import BackupReader, atomic_path
+from .restore import restore_records
+from .sqlmodel_backup import SQLModelBackup, split_jsonl_line
+
+
+class BackupManifest(BaseModel):
+    """
+    Files making up an incremental backup, and the high-water mark of every model when the last file was written.
+    """
+    sequence: int = 0
+    base: str | None = None
+    deltas: list[str] = []
+    marks: dict[str, Any] = {}
+
+    @property
+    def files(self) -> list[str]:
+        return ([self.base] if self.base else []) + self.deltas
+
+
+class IncrementalBackup(SQLModelBackup):
+    """
+    Back-up a SQLModel database Session() as a full snapshot plus deltas, replayed in order on restore.
+
+    Each model is tracked by a high-water mark column. By default that is the primary key, which only picks up new rows;
+    use a timestamp column that is set on every write to pick up changed rows too. Watermark columns must not be
+    nullable, rows without a mark would be in no delta. Deleted rows are only dropped from
+    the backup by compaction, which writes a new full snapshot every ``compact_every`` deltas.
+
+    :param session: SQLModel session for database operations.
+    :param models: List of SQLModel classes to backup.
+    :param output_dir: Directory to write backups to, files are kept in ``output_dir / 'incremental'``.
+    :param watermarks: High-water mark column name per model class, defaults to the primary key.
+    :param compact_every: Number of deltas to write before taking a new full snapshot.
+    :param chunk_size: Number of rows to fetch from the database at once.
+    """
+
+    def __init__(
+            self,
+            session: Session,
+            models: list[type(SQLModel)],
+            output_dir: Path,
+            watermarks: dict[type[SQLModel], str] | None = None,
+            compact_every: int = 24,
+            chunk_size: int = 1000,
+    ):
+        super().__init__(session, models, output_dir, stream=True, chunk_size=chunk_size)
+        watermarks = watermarks or {}
+        self.watermarks = {
+            json_key: watermarks.get(model_class) or primary_key_name(model_class)
+            for json_key, model_class in self.json_key_to_model_map.items()
+        }
+        for json_key, column_name in self.watermarks.items():
+            model_class = self.json_key_to_model_map[json_key]
+            if model_class.__table__.columns[column_name].nullable:
+                raise ValueError(f'Watermark {model_class.__name__}.{column_name} is nullable, it must always be set')
+        self.compact_every = compact_every
+        self.backup_dir = self.output_dir / 'incremental'
+        self.manifest_path = self.backup_dir / 'manifest.json'
+        self.backup_dir.mkdir(exist_ok=True)
+
+    def load_manifest(self, directory: Path | None = None) -> BackupManifest:
+        manifest_path = (directory or self.backup_dir) / 'manifest.json'
+        if not manifest_path.exists():
+            return BackupManifest()
+        return BackupManifest.model_validate_json(manifest_path.read_text())
+
+    def save_manifest(self, manifest: BackupManifest):
+        with atomic_path(self.manifest_path) as temp:
+            temp.write_text(manifest.model_dump_json(indent=2))
+
+    def mark_column(self, json_key: str) -> sqa.ColumnElement:
+        return getattr(self.json_key_to_model_map[json_key], self.watermarks[json_key])
+
+    def mark_adapter(self, json_key: str) -> TypeAdapter:
+        model_class = self.json_key_to_model_map[json_key]
+        return TypeAdapter(model_class.model_fields[self.watermarks[json_key]].annotation)
+
+    def current_marks(self) -> dict[str, Any]:
+        """
+        :returns: The current high-water mark of every model, None for empty tables.
+        """
+        return {
+            json_key: self.session.exec(select(sqa.func.max(self.mark_column(json_key)))).one()
+            for json_key in self.json_key_to_model_map
+        }
+
+    def dump_marks(self, marks: dict[str, Any]) -> dict[str, Any]:
+        return {key: self.mark_adapter(key).dump_python(mark, mode='json') for key, mark in marks.items()}
+
+    def load_marks(self, marks: dict[str, Any]) -> dict[str, Any]:
+        return {key: self.mark_adapter(key).validate_python(mark) for key, mark in marks.items()}
+
+    def window_queries(self, previous: dict[str, Any], current: dict[str, Any]) -> dict:
+        """
+        :returns: Select statement per model for rows between the previous and current high-water marks.
+            Primary key marks exclude the previous mark, other marks include it in case of rows written in the same
+            tick.
+        """
+        queries = {}
+        for json_key, model_class in self.json_key_to_model_map.items():
+            column = self.mark_column(json_key)
+            old, new = previous.get(json_key), current[json_key]
+            if new is None:
+                queries[json_key] = select(model_class).where(sqa.false())
+                continue
+            query = select(model_class).where(column <= new)
+            if old is not None:
+                is_pk = self.watermarks[json_key] == primary_key_name(model_class)
+                query = query.where(column > old if is_pk else column >= old)
+            queries[json_key] = query
+        return queries
+
+    def backup(self) -> dict[str, int]:
+        """
+        Write a delta of rows added or changed since the last backup, or a full snapshot if one is due.
+
+        :returns: Dictionary: {model.__name__ : number of records written}.
+        """
+        manifest = self.load_manifest()
+        if manifest.base is None or len(manifest.deltas) >= self.compact_every:
+            return self.compact()
+
+        marks = self.current_marks()
+        queries = self.window_queries(self.load_marks(manifest.marks), marks)
+        name = f'delta-{manifest.sequence + 1:06}.jsonl'
+        counts = self.write_stream(self.backup_dir / name, queries)
+        if not any(counts.values()):
+            (self.backup_dir / name).unlink()
+            logger.debug('No new or changed rows to backup')
+            return counts
+
+        manifest.sequence += 1
+        manifest.deltas.append(name)
+        manifest.marks = self.dump_marks(marks)
+        self.save_manifest(manifest)
+        logger.info(f'Saved {sum(counts.values())} new or changed rows to {name}', category='BACKUP')
+        return counts
+
+    def compact(self) -> dict[str, int]:
+        """
+        Write a full snapshot of every row as the new base of the backup, and remove the files it replaces.
+
+        :returns: Dictionary: {model.__name__ : number of records written}.
+        """
+        manifest = self.load_manifest()
+        marks = self.current_marks()
+        name = f'base-{manifest.sequence + 1:06}.jsonl'
+        queries = {json_key: select(model_class) for json_key, model_class in self.json_key_to_model_map.items()}
+        counts = self.write_stream(self.backup_dir / name, queries)
+
+        replaced = manifest.files
+        self.save_manifest(BackupManifest(sequence=manifest.sequence + 1, base=name, marks=self.dump_marks(marks)))
+        for old in replaced:
+            (self.backup_dir / old).unlink(missing_ok=True)
+        logger.info(f'Saved full snapshot of {sum(counts.values())} rows to {name}', category='BACKUP')
+        return counts
+
+    def written_size(self, counts: dict[str, int]) -> int:
+        """
+        :param counts: Result of the backup just made.
+        :returns: Size in bytes of the delta or snapshot the backup wrote, 0 if there was nothing to write.
+        """
+        files = self.load_manifest().files
+        if not files or not any(counts.values()):
+            return 0
+        return (self.backup_dir / files[-1]).stat().st_size
+
+    def restore(self, source: Path | None = None):
+        """
+        Restore database by replaying the base snapshot and every delta in order, later records overwriting earlier
+        ones.
+
+        :param source: Directory holding the backup, defaults to ``self.backup_dir``.
+        """
+        source = source or self.backup_dir
+        manifest = self.load_manifest(source)
+        if manifest.base is None:
+            logger.error(f'No incremental backup found in {source}')
+            return
+
+        try:
+            for name in manifest.files:
+                BackupReader(source / name).check()
+        except Exception as e:
+            logger.error(f'Error checking backup: {e}')
+            return
+
+        for name in manifest.files:
+            reader = BackupReader(source / name)
+            for json_key, lines in groupby((split_jsonl_line(_) for _ in reader), key=itemgetter(0)):
+                model_class = self.json_key_to_model_map.get(json_key)
+                if model_class is None:
+                    continue
+                records = (record for _, record in lines)
+                counts = restore_records(self.session, model_class, records, 'overwrite', self.chunk_size)
+                logger.info(
+                    f'Restored {counts.added} and updated {counts.updated} {json_key} from {name}',
+                    category='BACKUP'
+                )
+            self.session.commit()
+
+
+def primary_key_name(model_class: type[SQLModel]) -> str:
+    columns = list(model_class.__table__.primary_key.columns)
+    if len(columns) != 1:
+        raise NotImplementedError(f'{model_class.__name__} needs a watermark column, it has no single primary key')
+    return columns[0].key
@@ -0,0 +1,273 @@
+"""
+Indexed backups: one section per model and an offset index, so single models or key ranges can be restored
+without parsing the rest of the file
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import sqlalchemy as sqa
+from loguru import logger
+from pydantic import BaseModel
+from sqlmodel import SQLModel, Session, select
+
+from .backup_file import BackupIntegrityError, atomic_path
+from .restore import Conflict, RestoreCounts, restore_records
+from .sqlmodel_backup import SQLModelBackup
+
+MAGIC = b'PWIDX2\n'
+TRAILER = struct.Struct('<Q32s8s')
+TRAILER_MAGIC = b'PWINDEX\n'
+
+
+class Section(BaseModel):
+    """
+    Where a model's records are in the file, and the sha256 of its bytes. ``blocks`` holds the primary key and
+    offset of every ``block_size``-th record, records being written in primary key order.
+    """
+    offset: int
+    length: int
+    rows: int
+    key: list[str]
+    sha256: str = ''
+    blocks: list[tuple[Any, int]] = []
+
+
+class BackupIndex(BaseModel):
+    sections: dict[str, Section] = {}
+
+
+class IndexedBackup(SQLModelBackup):
+    """
+    Back-up a SQLModel database Session() to a file that can be restored selectively.
+
+    The file holds a section of JSON lines per model, ordered by primary key, followed by a JSON index of
+    section offsets and checksums, and a trailer pointing at the index with the index's own checksum. Restore
+    memory-maps the file and only reads the sections, and the blocks within them, that it needs. Sections read
+    are checked against their checksum before the session is touched.
+
+    :param session: SQLModel session for database operations.
+    :param models: List of SQLModel classes to backup.
+    :param output_dir: Directory to write backups to.
+    :param chunk_size: Number of rows to fetch from the database at once.
+    :param block_size: Number of records between index entries, smaller blocks make key ranges cheaper to find.
+    :param workers: Number of models to dump at once, see :class:`SQLModelBackup`.
+    """
+
+    def __init__(
+            self,
+            session: Session,
+            models: list[type(SQLModel)],
+            output_dir: Path,
+            chunk_size: int = 1000,
+            block_size: int = 1000,
+            workers: int = 1,
+    ):
+        super().__init__(session, models, output_dir, chunk_size=chunk_size, workers=workers)
+        self.block_size = block_size
+        self.backup_target = self.output_dir / 'backup.pwidx'
+        self.restore_target = self.output_dir / 'restore.pwidx'
+
+    def backup(self) -> dict[str, int]:
+        """
+        Backup ``self.session`` to ``self.backup_target``.
+
+        :returns: Dictionary: {model.__name__ : number of records written}.
+        """
+        index = self.write_indexed(self.backup_target)
+        counts = {json_key: section.rows for json_key, section in index.sections.items()}
+        logger.info(f'Saved {sum(counts.values())} models to {self.backup_target}', category='BACKUP')
+        return counts
+
+    def write_indexed(self, target: Path) -> BackupIndex:
+        """
+        Write every model's section, then the index and trailer, to ``target``.
+        """
+        index = BackupIndex()
+        with atomic_path(target) as temp, open(temp, 'wb') as f:
+            f.write(MAGIC)
+            if self.parallel:
+                self.write_sections_parallel(f, index)
+            else:
+                for json_key, model_class in self.json_key_to_model_map.items():
+                    index.sections[json_key] = self.write_section(f, self.session, model_class)
+            index_offset = f.tell()
+            index_json = index.model_dump_json().encode()
+            f.write(index_json)
+            f.write(TRAILER.pack(index_offset, hashlib.sha256(index_json).digest(), TRAILER_MAGIC))
+        return index
+
+    def write_sections_parallel(self, f: BinaryIO, index: BackupIndex):
+        """
+        Write every model to its own part file concurrently, then append the parts to ``f`` and move their offsets.
+        """
+        with tempfile.TemporaryDirectory() as parts_dir:
+            def write_part(session: Session, json_key: str, model_class: type[SQLModel]) -> Section:
+                with open(Path(parts_dir) / json_key, 'wb') as part:
+                    return self.write_section(part, session, model_class)
+
+            sections = self.parallel_dump(write_part)
+            for json_key in self.json_key_to_model_map:
+                section, start = sections[json_key], f.tell()
+                with open(Path(parts_dir) / json_key, 'rb') as part:
+                    shutil.copyfileobj(part, f)
+                section.offset += start
+                section.blocks = [(key, offset + start) for key, offset in section.blocks]
+                index.sections[json_key] = section
+
+    def write_section(self, f: BinaryIO, session: Session, model_class: type[SQLModel]) -> Section:
+        """
+        Write ``model_class`` records to ``f`` one line each, in primary key order.
+
+        :returns: Position and checksum of the section in ``f``, and position of every ``self.block_size``-th record.
+        """
+        key_names = primary_key_names(model_class)
+        query = select(model_class).order_by(*(getattr(model_class, _) for _ in key_names))
+        section = Section(offset=f.tell(), length=0, rows=0, key=key_names)
+        digest = hashlib.sha256()
+        for model_instance in session.exec(query.execution_options(yield_per=self.chunk_size)):
+            if section.rows % self.block_size == 0:
+                key = key_value(model_instance.model_dump(include=set(key_names)), key_names)
+                section.blocks.append((key, f.tell()))
+            line = model_instance.model_dump_json().encode() + b'\n'
+            digest.update(line)
+            f.write(line)
+            section.rows += 1
+        section.length = f.tell() - section.offset
+        section.sha256 = digest.hexdigest()
+        return section
+
+    def load_index(self, mm: mmap.mmap | bytes) -> BackupIndex:
+        """
+        :param mm: Contents of an indexed backup.
+        :returns: The backup's index.
+        :raises BackupIntegrityError: If the file is not an indexed backup, is truncated or its index is corrupt.
+        """
+        if mm[:len(MAGIC)] != MAGIC or len(mm) < len(MAGIC) + TRAILER.size:
+            raise BackupIntegrityError('Not an indexed backup')
+        index_offset, index_sha256, magic = TRAILER.unpack(mm[-TRAILER.size:])
+        if magic != TRAILER_MAGIC:
+            raise BackupIntegrityError('Indexed backup is truncated')
+        index_json = mm[index_offset:-TRAILER.size]
+        if hashlib.sha256(index_json).digest() != index_sha256:
+            raise BackupIntegrityError('Indexed backup index does not match its checksum')
+        return BackupIndex.model_validate_json(index_json)
+
+    def check_section(self, mm: mmap.mmap | bytes, json_key: str, section: Section):
+        """
+        :raises BackupIntegrityError: If the section's bytes don't match its checksum.
+        """
+        if hashlib.sha256(mm[section.offset:section.offset + section.length]).hexdigest() != section.sha256:
+            raise BackupIntegrityError(f'Indexed backup section {json_key} does not match its checksum')
+
+    def iter_records(
+            self,
+            mm: mmap.mmap | bytes,
+            section: Section,
+            start: Any = None,
+            stop: Any = None,
+    ) -> Iterator[str | dict]:
+        """
+        :param mm: Contents of an indexed backup.
+        :param section: Section to read, from :meth:`load_index`.
+        :param start: Lowest primary key to read, inclusive. A list for composite keys.
+        :param stop: Highest primary key to read, inclusive.
+        :returns: JSON string of every record in the range, or the decoded record when a range is given.
+        """
+        keys = [key for key, _ in section.blocks]
+        offsets = [offset for _, offset in section.blocks]
+        end = section.offset + section.length
+        position = section.offset
+        if start is not None and keys:
+            position = offsets[max(bisect.bisect_right(keys, start) - 1, 0)]
+        if stop is not None and keys:
+            after = bisect.bisect_right(keys, stop)
+            end = offsets[after] if after < len(offsets) else end
+
+        while position < end:
+            line_end = mm.find(b'\n', position, end)
+            line = mm[position:line_end].decode()
+            position = line_end + 1
+            if start is None and stop is None:
+                yield line
+                continue
+            record = json.loads(line)
+            key = key_value(record, section.key)
+            if start is not None and key < start:
+                continue
+            if stop is not None and key > stop:
+                return
+            yield record
+
+    def restore(
+            self,
+            conflict: Conflict = 'skip',
+            batch_size: int = 1000,
+            models: list[type[SQLModel]] | None = None,
+            start: Any = None,
+            stop: Any = None,
+    ) -> dict[str, RestoreCounts]:
+        """
+        Restore database from ``self.restore_target``, reading only the requested models and key range.
+        The index and the sections to restore are checked before the session is touched.
+
+        :param conflict: What to do with records already in the database: 'skip', 'overwrite' or 'merge'.
+        :param batch_size: Number of records per batch.
+        :param models: Models to restore, defaults to all of them.
+        :param start: Lowest primary key to restore, inclusive, applied to every model restored.
+        :param stop: Highest primary key to restore, inclusive.
+        :returns: Dictionary: {model.__name__ : records added, updated and skipped}.
+        """
+        wanted = self.json_key_to_model_map if models is None else {
+            json_key: model_class for json_key, model_class in self.json_key_to_model_map.items()
+            if model_class in models
+        }
+        results = {}
+        mm = None
+        try:
+            with open(self.restore_target, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            index = self.load_index(mm)
+            sections = {json_key: index.sections[json_key] for json_key in wanted if json_key in index.sections}
+            for json_key, section in sections.items():
+                self.check_section(mm, json_key, section)
+        except Exception as e:
+            if mm is not None:
+                mm.close()
+            logger.error(f'Error loading indexed backup: {e}')
+            return results
+
+        with mm:
+            for json_key, section in sections.items():
+                model_class = wanted[json_key]
+                records = self.iter_records(mm, section, start, stop)
+                results[json_key] = counts = restore_records(self.session, model_class, records, conflict, batch_size)
+                if counts.added or counts.updated:
+                    logger.info(
+                        f'Loaded {counts.added} and updated {counts.updated} {json_key} from {self.restore_target}',
+                        category='BACKUP'
+                    )
+        self.session.commit()
+        return results
+
+
+def primary_key_names(model_class: type[SQLModel]) -> list[str]:
+    return [column.key for column in sqa.inspect(model_class).primary_key]
+
+
+def key_value(record: dict, key_names: list[str]) -> Any:
+    """
+    :returns: The record's primary key, a list for composite keys.
+    """
+    if len(key_names) == 1:
+        return record[key_names[0]]
+    return [record[_] for _ in key_names]
@@ -0,0 +1,201 @@
+"""
+Filter and index on fields inside :class:`PydanticJSONColumn` columns in SQL
+
+``json_path(Table.column)`` follows the column's ``model_class``, so field names are checked when the query is built,
+and ends in a typed SQL expression once a field that isn't a model is reached::
+
+    select(TestModel).where(json_path(TestModel.alert).type == AlertType.WARNING)
+    select(TestModel).where(json_path(TestModel.alerts_list)[0].code > 3)
+    json_index(json_path(TestModel.alert).type)
+
+Paths are rendered inline (not as bound parameters) so the database can match them to expression indexes:
+``JSON_EXTRACT`` on SQLite, ``#>>`` on PostgreSQL and SQLAlchemy's generic JSON path operators elsewhere.
+Only ``native=True`` columns hold JSON the database can look into.
+"""
+from __future__ import annotations
+
+import datetime
+import types
+import typing as _t
+from enum import Enum
+
+import sqlalchemy as sqa
+from pydantic import BaseModel
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import QueryableAttribute
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+from . import PydanticJSONColumn
+
+PathKey = str | int
+
+
+class json_field(FunctionElement):
+    """
+    SQL expression extracting the value at a JSON path, typed as ``type_``.
+
+    The path is a plain attribute, not a bound parameter, so it is part of the statement cache key.
+    """
+    name = 'json_field'
+    inherit_cache = False
+    _traverse_internals = [
+        *FunctionElement._traverse_internals,
+        ('path', InternalTraversal.dp_plain_obj),
+        ('type', InternalTraversal.dp_type),
+    ]
+
+    def __init__(self, column: sqa.ColumnElement, path: tuple[PathKey, ...], type_: sqa.types.TypeEngine):
+        self.type = type_
+        self.path = tuple(path)
+        super().__init__(column)
+
+    @property
+    def column(self) -> sqa.ColumnElement:
+        return self.clauses.clauses[0]
+
+
+@compiles(json_field)
+def compile_json_field(element: json_field, compiler, **kw):
+    expr = sqa.type_coerce(element.column, sqa.JSON)[element.path]
+    if isinstance(element.type, sqa.Boolean):
+        expr = expr.as_boolean()
+    elif isinstance(element.type, sqa.Integer):
+        expr = expr.as_integer()
+    elif isinstance(element.type, sqa.Float):
+        expr = expr.as_float()
+    elif isinstance(element.type, sqa.String):
+        expr = expr.as_string()
+    else:
+        expr = expr.as_json()
+    return compiler.process(expr, **{**kw, 'literal_binds': True})
+
+
+@compiles(json_field, 'sqlite')
+def compile_json_field_sqlite(element: json_field, compiler, **kw):
+    path = '$' + ''.join(f'[{_}]' if isinstance(_, int) else f'."{_}"' for _ in element.path)
+    column = compiler.process(element.column, **kw)
+    return f'JSON_EXTRACT({column}, {compiler.render_literal_value(path, sqa.String())})'
+
+
+@compiles(json_field, 'postgresql')
+def compile_json_field_postgresql(element: json_field, compiler, **kw):
+    path = '{' + ','.join(f'"{_}"' if isinstance(_, str) else str(_) for _ in element.path) + '}'
+    column = compiler.process(element.column, **kw)
+    operator = '#>>' if isinstance(element.type, sqa.String | sqa.Integer | sqa.Float | sqa.Boolean) else '#>'
+    expr = f'({column} {operator} {compiler.render_literal_value(path, sqa.String())})'
+    if isinstance(element.type, sqa.String) or operator == '#>':
+        return expr
+    return f'CAST({expr} AS {compiler.dialect.type_compiler_instance.process(element.type)})'
+
+
+def sql_type(annotation) -> sqa.types.TypeEngine:
+    """
+    :return: The SQL type of a JSON value holding ``annotation``.
+    """
+    if isinstance(annotation, type):
+        if issubclass(annotation, bool):
+            return sqa.Boolean()
+        elif issubclass(annotation, int):
+            return sqa.Integer()
+        elif issubclass(annotation, float):
+            return sqa.Float()
+        elif issubclass(annotation, str | datetime.date | datetime.time):
+            return sqa.String()
+        elif issubclass(annotation, Enum):
+            values = {type(_.value) for _ in annotation}
+            return sqa.Integer() if values == {int} else sqa.String()
+    return sqa.JSON()
+
+
+def unwrap_optional(annotation):
+    if _t.get_origin(annotation) in (_t.Union, types.UnionType):
+        arms = [_ for _ in _t.get_args(annotation) if _ is not type(None)]
+        if len(arms) == 1:
+            return arms[0]
+    return annotation
+
+
+def is_model(annotation) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+class JSONPath:
+    """
+    A path into a JSON column, following the fields of a pydantic model. See :func:`json_path`.
+    """
+
+    def __init__(self, column: sqa.ColumnElement, annotation, path: tuple[PathKey, ...] = (), root: bool = False):
+        self._column = column
+        self._annotation = unwrap_optional(annotation)
+        self._path = path
+        self._root = root
+
+    def _step(self, key: PathKey, annotation) -> JSONPath | json_field:
+        annotation = unwrap_optional(annotation)
+        path = (*self._path, key)
+        if is_model(annotation) or _t.get_origin(annotation) in (list, tuple, dict):
+            return JSONPath(self._column, annotation, path)
+        return json_field(self._column, path, sql_type(annotation))
+
+    def __getattr__(self, name: str) -> JSONPath | json_field:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if not is_model(self._annotation):
+            raise AttributeError(f'{self._annotation} has no fields, index it instead')
+        fields = self._annotation.model_fields
+        if name not in fields:
+            raise AttributeError(f'{self._annotation.__name__} has no field {name}')
+        field = fields[name]
+        return self._step(field.alias or name, field.annotation)
+
+    def __getitem__(self, key: PathKey) -> JSONPath | json_field:
+        if self._root and is_model(self._annotation):
+            return self._step(key, self._annotation)
+        origin = _t.get_origin(self._annotation)
+        args = _t.get_args(self._annotation)
+        if origin is list:
+            return self._step(key, args[0])
+        elif origin is tuple:
+            return self._step(key, args[0] if args[-1] is Ellipsis else args[key])
+        elif origin is dict:
+            return self._step(key, args[1])
+        raise TypeError(f'{self._annotation} can not be indexed')
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._column}, {self._path})'
+
+
+def json_path(attribute: QueryableAttribute | sqa.Column) -> JSONPath:
+    """
+    Start a typed path into a JSON column.
+
+    :param attribute: A mapped attribute (e.g. ``TestModel.alert``) or Column,
+        of type ``PydanticJSONColumn(native=True)``.
+    :return: A :class:`JSONPath` following the column's ``model_class``.
+    """
+    column = attribute.property.columns[0] if isinstance(attribute, QueryableAttribute) else attribute
+    column_type = column.type
+    if not isinstance(column_type, PydanticJSONColumn):
+        raise TypeError(f'{column} is not a PydanticJSONColumn')
+    if not column_type.native:
+        raise ValueError(f'{column} stores JSON strings, querying inside it requires a native=True column')
+    return JSONPath(column, column_type.model_class, root=True)
+
+
+def json_index(*fields: json_field, name: str | None = None, unique: bool = False, **kwargs) -> sqa.Index:
+    """
+    Declare an expression index on JSON paths, after the SQLModel class is defined::
+
+        json_index(json_path(TestModel.alert).type)
+
+    :param fields: Expressions from :func:`json_path`.
+    :param name: Index name, defaults to ``ix_<table>_<column>_<path>``.
+    :param unique: Create a unique index.
+    :return: The Index, attached to the table of the first field.
+    """
+    if name is None:
+        first = fields[0]
+        path = '_'.join(str(_) for _ in first.path)
+        name = f'ix_{first.column.table.name}_{first.column.name}_{path}'
+    return sqa.Index(name, *fields, unique=unique, **kwargs)
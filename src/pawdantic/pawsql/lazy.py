@@ -0,0 +1,111 @@
+"""
+Defer validating JSON column values until they are first used
+"""
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+_UNSET = object()
+
+
+class LazyJSON:
+    """
+    Proxy for a model stored in a JSON column that keeps the stored JSON and validates it on first access.
+
+    Attribute access, item access, iteration, comparison and ``repr`` go to the validated model,
+    which is cached on the proxy. ``isinstance`` checks and pydantic serialization see the model too, since
+    ``__class__`` and ``__dict__`` are the model's. An unread proxy is written back to the database as the stored
+    JSON, without validating or dumping it. Use :attr:`value` to get the model itself.
+
+    Containers of models get a proxy per model, see :func:`lazy_container`.
+
+    :param raw: The value as decoded by the column's ``impl``.
+    :param load: Callable that turns ``raw`` into a model.
+    """
+
+    __slots__ = ('_raw', '_load', '_value')
+
+    def __init__(self, raw, load: Callable[[Any], Any]):
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_load', load)
+        object.__setattr__(self, '_value', _UNSET)
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not _UNSET
+
+    @property
+    def raw(self):
+        """The stored JSON, only available until the value is loaded (after which it may have been changed)."""
+        if self.loaded:
+            raise AttributeError('LazyJSON value already loaded')
+        return self._raw
+
+    @property
+    def value(self):
+        if self._value is _UNSET:
+            object.__setattr__(self, '_value', self._load(self._raw))
+            object.__setattr__(self, '_raw', None)
+        return self._value
+
+    @property
+    def __class__(self):
+        return type(self.value)
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.value, name, value)
+
+    def __eq__(self, other):
+        return self.value == (other.value if type(other) is LazyJSON else other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __bool__(self):
+        return bool(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __contains__(self, item):
+        return item in self.value
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __setitem__(self, key, value):
+        self.value[key] = value
+
+    def __delitem__(self, key):
+        del self.value[key]
+
+    def __repr__(self):
+        if not self.loaded:
+            return f'{type(self).__name__}(<not loaded>)'
+        return repr(self.value)
+
+    def __str__(self):
+        return str(self.value)
+
+
+
+def lazy_container(items: list | tuple | dict, container: type, load: Callable[[Any], Any]) -> list | tuple | dict:
+    """
+    :param items: Stored models, as decoded JSON.
+    :param container: ``list``, ``tuple`` or ``dict``.
+    :param load: Callable that turns one stored model into a model.
+    :return: A real container of :class:`LazyJSON` proxies, so pydantic serializes and validates it as usual.
+    """
+    if container is dict:
+        return {key: LazyJSON(item, load) for key, item in items.items()}
+    return container(LazyJSON(item, load) for item in items)
@@ -0,0 +1,90 @@
+"""
+Rewrite stored JSON column values between storage formats
+"""
+from __future__ import annotations
+
+import json
+
+import sqlalchemy as sqa
+from loguru import logger
+from sqlmodel import SQLModel, Session
+
+from . import PydanticJSONColumn
+
+
+def json_columns(model_class: type[SQLModel]) -> list[sqa.Column]:
+    """
+    :param model_class: A SQLModel table class.
+    :return: The columns of the table that store pydantic models as JSON.
+    """
+    return [_ for _ in model_class.__table__.columns if isinstance(_.type, PydanticJSONColumn)]
+
+
+def decode_legacy(value, column_type: PydanticJSONColumn):
+    """
+    Convert a double-encoded value (JSON strings inside JSON) to its native form, leaving native values as they are.
+
+    :param value: A value as decoded once by ``sqlalchemy.JSON``.
+    :param column_type: The column the value was read from.
+    :return: The same value with every embedded JSON string decoded.
+    """
+    if isinstance(value, str):
+        return json.loads(value)
+    elif isinstance(value, list | tuple):
+        return [json.loads(_) if isinstance(_, str) else _ for _ in value]
+    elif isinstance(value, dict) and column_type.container is dict:
+        return {key: json.loads(_) if isinstance(_, str) else _ for key, _ in value.items()}
+    return value
+
+
+def migrate_to_native(session: Session, model_class: type[SQLModel], batch_size: int = 1000) -> int:
+    """
+    Rewrite double-encoded rows of ``model_class`` so they can be read by ``native=True`` columns.
+
+    Rows are read and updated ``batch_size`` at a time in primary key order, committing after every batch,
+    so the migration can be interrupted and re-run. Rows that are already native are left untouched.
+
+    :param session: Session bound to the database to migrate.
+    :param model_class: SQLModel table class with one or more :class:`PydanticJSONColumn` columns.
+    :param batch_size: Number of rows to read and update per transaction.
+    :return: Number of rows rewritten.
+    """
+    table = model_class.__table__
+    columns = json_columns(model_class)
+    pks = list(table.primary_key.columns)
+    if not columns:
+        return 0
+    if len(pks) != 1:
+        raise NotImplementedError(f'{model_class.__name__} must have exactly one primary key column')
+    pk = pks[0]
+
+    raw_columns = [sqa.type_coerce(_, sqa.JSON).label(_.name) for _ in columns]
+    update = (
+        sqa.update(table)
+        .where(pk == sqa.bindparam('_pk'))
+        .values({_.name: sqa.bindparam(f'_{_.name}', type_=sqa.JSON) for _ in columns})
+    )
+
+    migrated = 0
+    last = None
+    while True:
+        query = sqa.select(pk, *raw_columns).order_by(pk).limit(batch_size)
+        if last is not None:
+            query = query.where(pk > last)
+        rows = session.execute(query).all()
+        if not rows:
+            break
+        last = rows[-1][0]
+
+        params = []
+        for row in rows:
+            new = {_.name: decode_legacy(row._mapping[_.name], _.type) for _ in columns}
+            if any(new[_.name] != row._mapping[_.name] for _ in columns):
+                params.append({'_pk': row[0], **{f'_{name}': value for name, value in new.items()}})
+        if params:
+            session.execute(update, params)
+            session.commit()
+            migrated += len(params)
+
+    logger.info(f'Migrated {migrated} {model_class.__name__} rows to native JSON')
+    return migrated
@@ -0,0 +1,247 @@
+"""
+Track in-place changes to models, lists, dicts and tuples held in :class:`PydanticJSONColumn` columns
+
+Values read from or assigned to a ``mutable=True`` column are wrapped so that changing them in place flags the
+attribute as modified, the same way as :mod:`sqlalchemy.ext.mutable`. Tracked are: attribute assignment on a model,
+list / dict operations, and attribute assignment on models held in a list, dict or tuple, including models added
+to them later.
+Deeper changes (e.g. to a model nested inside a stored model) still need the value reassigning.
+
+Before each flush, tracked values are compared by hash with the value loaded from the database,
+and unchanged values are not written. The flush listener is registered when the first mutable column is built,
+see :func:`listen_for_flushes`.
+"""
+from __future__ import annotations
+
+import weakref
+from collections.abc import Iterable
+from functools import cache
+
+from pydantic import BaseModel
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.mutable import Mutable, MutableDict, MutableList
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import NO_VALUE, set_committed_value
+
+from .codec import SAME_AS, digest
+
+
+class MutablePydantic(Mutable):
+    """
+    Base of every tracked wrapper, associate with a column type using ``MutablePydantic.as_mutable(column_type)``.
+    """
+
+    @classmethod
+    def coerce(cls, key: str, value):
+        if value is None or isinstance(value, MutablePydantic):
+            return value
+        return track(value)
+
+
+class TrackedItem(MutablePydantic):
+    """
+    Mixin for models: report attribute assignment to the attributes (or container) holding the model.
+    """
+    __slots__ = ()
+
+    @property
+    def _parents(self) -> weakref.WeakKeyDictionary:
+        parents = getattr(self, '_pw_parents', None)
+        if parents is None:
+            parents = weakref.WeakKeyDictionary()
+            object.__setattr__(self, '_pw_parents', parents)
+        return parents
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        self.changed()
+
+    def __delattr__(self, name):
+        super().__delattr__(name)
+        self.changed()
+
+    def changed(self) -> None:
+        super().changed()
+        container = getattr(self, '_pw_container', None)
+        if container is not None:
+            container.changed()
+
+    def __eq__(self, other):
+        if not isinstance(other, SAME_AS[type(self)]):
+            return NotImplemented
+        return (
+                self.__dict__ == other.__dict__
+                and self.__pydantic_private__ == other.__pydantic_private__
+                and self.__pydantic_extra__ == other.__pydantic_extra__
+        )
+
+    __hash__ = None
+
+
+class TrackedList(MutablePydantic, MutableList):
+    """
+    List wrapping the models put into it, so later changes to them are tracked too.
+    """
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [track_item(_, self) for _ in value]
+        else:
+            value = track_item(value, self)
+        super().__setitem__(index, value)
+
+    def append(self, x):
+        super().append(track_item(x, self))
+
+    def extend(self, x):
+        super().extend([track_item(_, self) for _ in x])
+
+    def insert(self, i, x):
+        super().insert(i, track_item(x, self))
+
+
+class TrackedDict(MutablePydantic, MutableDict):
+    """
+    Dict wrapping the models put into it, so later changes to them are tracked too.
+    """
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, track_item(value, self))
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        super().update({key: track_item(item, self) for key, item in dict(*args, **kwargs).items()})
+
+
+class TrackedTuple(MutablePydantic, tuple):
+    """
+    Tuples can't change, but the models they hold can.
+    """
+
+
+@cache
+def tracked_model(model_class: type[BaseModel]) -> type[BaseModel]:
+    """
+    :return: A subclass of ``model_class`` reporting attribute assignment, built once per model.
+    """
+    namespace = {
+        '__slots__': ('_pw_parents', '_pw_container', '_pw_baseline'),
+        '__module__': model_class.__module__,
+    }
+    if model_class.__hash__ is not None:
+        namespace['__hash__'] = model_class.__hash__
+    tracked = type(f'Tracked{model_class.__name__}', (TrackedItem, model_class), namespace)
+    SAME_AS[tracked] = model_class
+    return tracked
+
+
+def track_model(model: BaseModel, container: MutablePydantic | None = None) -> BaseModel:
+    """
+    :return: A tracked copy of ``model``, sharing its field values.
+    """
+    if isinstance(model, TrackedItem):
+        object.__setattr__(model, '_pw_container', container)
+        return model
+    tracked = object.__new__(tracked_model(type(model)))
+    object.__setattr__(tracked, '__dict__', dict(model.__dict__))
+    object.__setattr__(tracked, '__pydantic_fields_set__', set(model.__pydantic_fields_set__))
+    object.__setattr__(tracked, '__pydantic_extra__', model.__pydantic_extra__)
+    object.__setattr__(tracked, '__pydantic_private__', model.__pydantic_private__)
+    object.__setattr__(tracked, '_pw_container', container)
+    object.__setattr__(tracked, '_pw_baseline', None)
+    return tracked
+
+
+def track(value, baseline=None) -> MutablePydantic:
+    """
+    Wrap a column value for change tracking.
+
+    :param value: A model, or list / dict / tuple of models.
+    :param baseline: The value as stored in the database, if ``value`` was just read from it.
+    :return: The tracked value.
+    """
+    if isinstance(value, BaseModel):
+        tracked = track_model(value)
+    elif isinstance(value, dict):
+        tracked = TrackedDict()
+        dict.update(tracked, {key: track_item(item, tracked) for key, item in value.items()})
+    elif isinstance(value, list):
+        tracked = TrackedList()
+        list.extend(tracked, [track_item(item, tracked) for item in value])
+    elif isinstance(value, tuple):
+        tracked = TrackedTuple(track_item(item, None) for item in value)
+        for item in tracked:
+            if isinstance(item, TrackedItem):
+                object.__setattr__(item, '_pw_container', tracked)
+    else:
+        raise ValueError(f'Can not track changes to {type(value)}')
+    object.__setattr__(tracked, '_pw_baseline', baseline)
+    return tracked
+
+
+def track_item(item, container: MutablePydantic | None):
+    return track_model(item, container) if isinstance(item, BaseModel) else item
+
+
+def baseline_digest(value: MutablePydantic) -> bytes | None:
+    """
+    :return: Hash of the value as last read from or written to the database, None if not read from the database.
+    """
+    baseline = getattr(value, '_pw_baseline', None)
+    if baseline is not None and not isinstance(baseline, bytes):
+        baseline = digest(baseline)
+        object.__setattr__(value, '_pw_baseline', baseline)
+    return baseline
+
+
+def track_assignments(class_: type, keys: Iterable[str]) -> None:
+    """
+    Wrap values assigned to the mutable columns ``keys`` of a mapped class before they are stored.
+
+    SQLModel hands the assigned value to SQLAlchemy, which tracks a wrapped copy, then stores the value it was given
+    in ``__dict__`` itself. Wrapping it first makes both hold the same tracked value.
+    """
+    keys = frozenset(keys)
+    if not keys:
+        return
+    setattr_ = class_.__setattr__
+
+    def __setattr__(self, name, value):
+        if name in keys:
+            value = MutablePydantic.coerce(name, value)
+        setattr_(self, name, value)
+
+    class_.__setattr__ = __setattr__
+
+
+def listen_for_flushes() -> None:
+    """
+    Register :func:`skip_unchanged` on Sessions, once, so sessions of programs without mutable columns are left alone.
+    """
+    if not event.contains(Session, 'before_flush', skip_unchanged):
+        event.listen(Session, 'before_flush', skip_unchanged)
+
+
+def skip_unchanged(session: Session, flush_context, instances) -> None:
+    """
+    Un-flag tracked values that were changed in place but still hash the same as the stored value.
+    """
+    for instance in session.dirty:
+        state = inspect(instance)
+        for key, committed in list(state.committed_state.items()):
+            value = state.dict.get(key)
+            if committed is not NO_VALUE or not isinstance(value, MutablePydantic):
+                continue
+            baseline = baseline_digest(value)
+            if baseline is None:
+                continue
+            column_type = state.mapper.columns[key].type
+            current = digest(column_type.process_bind_param(value, session.bind.dialect if session.bind else None))
+            if current == baseline:
+                set_committed_value(instance, key, value)
+            else:
+                object.__setattr__(value, '_pw_baseline', current)
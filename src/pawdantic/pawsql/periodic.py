@@ -0,0 +1,140 @@
+"""
+Run blocking backup jobs from asyncio without blocking the event loop, and keep stats about each run
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import NamedTuple
+
+from loguru import logger
+from pydantic import BaseModel
+
+
+class RunResult(NamedTuple):
+    rows: int = 0
+    bytes: int = 0
+
+
+class BackupStats(BaseModel):
+    """
+    Counters and timings of a periodic job, e.g. to return from a health endpoint.
+    """
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    skipped_overlap: int = 0
+    skipped_unchanged: int = 0
+    running: bool = False
+    last_started: datetime | None = None
+    last_duration: float | None = None
+    last_rows: int | None = None
+    last_bytes: int | None = None
+    last_error: str | None = None
+    total_rows: int = 0
+    total_bytes: int = 0
+
+    def started(self):
+        self.running = True
+        self.last_started = datetime.now()
+
+    def succeeded(self, duration: float, result: RunResult):
+        self.running = False
+        self.runs += 1
+        self.consecutive_failures = 0
+        self.last_duration = duration
+        self.last_rows, self.last_bytes = result
+        self.last_error = None
+        self.total_rows += result.rows
+        self.total_bytes += result.bytes
+
+    def unchanged(self):
+        self.running = False
+        self.skipped_unchanged += 1
+        self.consecutive_failures = 0
+
+    def failed(self, duration: float, error: Exception):
+        self.running = False
+        self.runs += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_duration = duration
+        self.last_error = repr(error)
+
+
+async def run_guarded(
+        job: Callable[[], RunResult | None],
+        lock: threading.Lock,
+        stats: BackupStats,
+        executor: Executor | None = None,
+) -> bool:
+    """
+    Run ``job`` in ``executor``, unless a previous run still holds ``lock``.
+    ``job`` returns None if it found nothing to do, counted in ``stats.skipped_unchanged`` rather than as a run.
+
+    The lock is released by the worker thread when the job finishes, so cancelling the awaiting task
+    can not let a second run overlap one that is still going.
+
+    :returns: True if the job ran, or found nothing to do, and succeeded.
+    """
+    if not lock.acquire(blocking=False):
+        stats.skipped_overlap += 1
+        logger.warning('Previous run still going, skipping')
+        return False
+
+    def guarded() -> RunResult | None:
+        try:
+            return job()
+        finally:
+            lock.release()
+
+    stats.started()
+    started = time.monotonic()
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(executor, guarded)
+    except Exception as e:
+        stats.failed(time.monotonic() - started, e)
+        logger.exception(f'Run failed ({stats.consecutive_failures} in a row): {e}')
+        return False
+    if result is None:
+        stats.unchanged()
+    else:
+        stats.succeeded(time.monotonic() - started, result)
+    return True
+
+
+def next_delay(interval: float, stats: BackupStats, jitter: float, max_backoff: float) -> float:
+    """
+    :returns: ``interval``, doubled for every consecutive failure up to ``max_backoff``,
+        then moved randomly by up to ``jitter`` of itself so that many loops don't fire together.
+    """
+    delay = min(interval * 2 ** stats.consecutive_failures, max(max_backoff, interval))
+    return max(0.0, delay * (1 + random.uniform(-jitter, jitter)))
+
+
+async def run_periodically(
+        job: Callable[[], RunResult | None],
+        interval: float,
+        stats: BackupStats,
+        lock: threading.Lock,
+        executor: Executor | None = None,
+        jitter: float = 0.1,
+        max_backoff: float | None = None,
+):
+    """
+    Run ``job`` now and then every ``interval`` seconds, see :func:`run_guarded` and :func:`next_delay`.
+
+    :param max_backoff: Longest wait after failures, defaults to 8 times ``interval``.
+    """
+    max_backoff = interval * 8 if max_backoff is None else max_backoff
+    while True:
+        logger.debug('Waking')
+        await run_guarded(job, lock, stats, executor)
+        delay = next_delay(interval, stats, jitter, max_backoff)
+        logger.debug(f'Sleeping for {delay:.1f} seconds')
+        await asyncio.sleep(delay)
@@ -0,0 +1,151 @@
+"""
+Restore backed-up records in batches: validate, look up existing primary keys and write, a few statements per batch
+"""
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from functools import cache
+from typing import Literal, NamedTuple
+
+import sqlalchemy as sqa
+from sqlalchemy.schema import sort_tables
+from pydantic import BaseModel, Json, TypeAdapter, create_model
+from sqlmodel import SQLModel, Session
+
+from .bulk import batches, bulk_insert, bulk_update
+
+Conflict = Literal['skip', 'overwrite', 'merge']
+
+
+class RestoreCounts(NamedTuple):
+    added: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+    def __add__(self, other: RestoreCounts) -> RestoreCounts:
+        return RestoreCounts(*(a + b for a, b in zip(self, other)))
+
+
+class RestoreProgress(NamedTuple):
+    model: str
+    done: int
+    total: int | None
+
+
+@cache
+def record_adapter(model_class: type[SQLModel], encoded: bool) -> TypeAdapter | None:
+    """
+    Table models skip validation outside ``model_validate``, so validate batches against a plain copy of their fields.
+
+    :param model_class: SQLModel table class.
+    :param encoded: Records are JSON strings rather than dicts.
+    :return: TypeAdapter for a list of records, built once per model, None if the model has validators of its own.
+    """
+    decorators = model_class.__pydantic_decorators__
+    if any((decorators.validators, decorators.field_validators, decorators.root_validators,
+            decorators.model_validators)):
+        return None
+    fields = {name: (field.annotation, field) for name, field in model_class.model_fields.items()}
+    record = create_model(f'{model_class.__name__}Record', **fields)
+    return TypeAdapter(list[Json[record]] if encoded else list[record])
+
+
+def validate_records(model_class: type[SQLModel], records: list[str | dict]) -> list[BaseModel]:
+    """
+    :param model_class: SQLModel table class.
+    :param records: JSON strings or dicts, as written by ``model_dump_json``.
+    :return: Validated records, with an attribute per column.
+    """
+    encoded = bool(records) and isinstance(records[0], str)
+    adapter = record_adapter(model_class, encoded)
+    if adapter is not None:
+        return adapter.validate_python(records)
+    validate = model_class.model_validate_json if encoded else model_class.model_validate
+    return [validate(_) for _ in records]
+
+
+def is_link_table(table: sqa.Table) -> bool:
+    """
+    :return: True if the table's primary key is made only of foreign keys, as in many-to-many association tables.
+    """
+    pk = list(table.primary_key.columns)
+    return len(pk) > 1 and all(column.foreign_keys for column in pk)
+
+
+def dependency_order(model_classes: Iterable[type[SQLModel]]) -> list[type[SQLModel]]:
+    """
+    :return: ``model_classes`` ordered so that tables come after the tables their foreign keys point at,
+        with link tables last.
+    """
+    by_table = {model_class.__table__: model_class for model_class in model_classes}
+    tables = sort_tables(by_table)
+    return [by_table[_] for _ in tables if not is_link_table(_)] + [by_table[_] for _ in tables if is_link_table(_)]
+
+
+def existing_keys(session: Session, model_class: type[SQLModel], keys: list) -> set:
+    """
+    :return: Those of ``keys`` (primary key values, tuples for composite keys) already in the database, in one query.
+    """
+    pk = list(model_class.__table__.primary_key.columns)
+    if len(pk) == 1:
+        return set(session.execute(sqa.select(pk[0]).where(pk[0].in_(keys))).scalars())
+    return {tuple(_) for _ in session.execute(sqa.select(*pk).where(sqa.tuple_(*pk).in_(keys)))}
+
+
+def restore_records(
+        session: Session,
+        model_class: type[SQLModel],
+        records: Iterable[str | dict],
+        conflict: Conflict = 'skip',
+        batch_size: int = 1000,
+        commit: bool = False,
+        on_batch: Callable[[RestoreCounts], None] | None = None,
+) -> RestoreCounts:
+    """
+    Restore records into ``model_class``'s table, ``batch_size`` at a time.
+
+    :param session: Session to restore into.
+    :param model_class: SQLModel table class.
+    :param records: JSON strings or dicts, as written by ``model_dump_json``.
+    :param conflict: What to do with records whose primary key already exists:
+        'skip' keeps the existing row, 'overwrite' replaces it with the record,
+        'merge' updates it with the record's values that are not None.
+    :param batch_size: Records per batch, which is also the number of keys in each existence query.
+    :param commit: Commit after every batch, rather than leaving the transaction to the caller.
+    :param on_batch: Called with the counts of every batch once it is written, e.g. to report progress.
+    :return: Number of rows added, updated and skipped.
+    """
+    pk = [_.key for _ in model_class.__table__.primary_key.columns]
+    counts = RestoreCounts()
+
+    for batch in batches(records, batch_size):
+        rows = validate_records(model_class, batch)
+        keyed = {}
+        new = []
+        for row in rows:
+            key = tuple(getattr(row, _) for _ in pk)
+            if any(_ is None for _ in key):
+                new.append(row)
+            else:
+                keyed[key[0] if len(pk) == 1 else key] = row
+
+        existing = existing_keys(session, model_class, list(keyed)) if keyed else set()
+        new.extend(row for key, row in keyed.items() if key not in existing)
+        found = [row for key, row in keyed.items() if key in existing]
+
+        if new:
+            bulk_insert(session, model_class, new, batch_size=batch_size, return_keys=False)
+        if found and conflict != 'skip':
+            bulk_update(session, model_class, found, batch_size=batch_size, skip_none=conflict == 'merge')
+        batch_counts = RestoreCounts(
+            added=len(new),
+            updated=len(found) if conflict != 'skip' else 0,
+            skipped=len(found) if conflict == 'skip' else 0,
+        )
+        counts += batch_counts
+        if commit:
+            session.commit()
+        if on_batch is not None:
+            on_batch(batch_counts)
+
+    return counts
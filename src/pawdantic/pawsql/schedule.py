@@ -1,20 +1,42 @@
 from __future__ import annotations
 
-import asyncio
-
 from suppawt.backupaw import Pruner
+from .periodic import RunResult, run_periodically
 from .sqlmodel_backup import SQLModelBackup
 
 
-async def schedule_backup_prune(backupbot: SQLModelBackup, pruner_bot: Pruner, sleep: int):
+async def schedule_backup_prune(
+        backupbot: SQLModelBackup,
+        pruner_bot: Pruner,
+        sleep: int,
+        jitter: float = 0.1,
+        max_backoff: float | None = None,
+):
     """
     Runs backup, copy, and prune operations in a loop with a specified sleep interval.
 
+    Operations run on the backup's own thread, stopped when the loop ends, so the event loop is not blocked, and
+    are recorded in ``backupbot.stats``. A cycle is skipped if the previous one is still running, or if nothing
+    changed since the last backup when ``backupbot.skip_unchanged`` is set - then there is nothing new to copy or
+    prune either.
+
     :param backupbot: An instance of SQLModelBot for handling database backup operations.
     :param pruner_bot: An instance of Pruner for handling file pruning operations.
     :param sleep: Time in seconds to wait between each backup operation.
+    :param jitter: Fraction of ``sleep`` to randomly add or remove from each wait.
+    :param max_backoff: Longest wait after consecutive failures, defaults to 8 times ``sleep``.
     """
-    while True:
-        backupbot.backup()
+
+    def backup_prune() -> RunResult | None:
+        result = backupbot.run()
+        if result is None:
+            return None
         pruner_bot.copy_and_prune()
-        await asyncio.sleep(sleep)
+        return result
+
+    try:
+        await run_periodically(
+            backup_prune, sleep, backupbot.stats, backupbot.lock, backupbot.executor, jitter, max_backoff
+        )
+    finally:
+        backupbot.close(wait=False)
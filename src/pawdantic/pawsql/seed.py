@@ -0,0 +1,144 @@
+"""
+Seeded template databases: build and fill an in-memory SQLite database once, then hand out copies made with SQLite's
+backup API, much cheaper than creating and filling a database per test
+"""
+from __future__ import annotations
+
+import datetime
+import enum
+import inspect
+import types
+import typing
+from collections.abc import Callable, Sequence
+from typing import Any, Union
+
+from loguru import logger
+from pydantic import BaseModel
+from sqlalchemy import Engine, MetaData
+from sqlmodel import SQLModel, Session, StaticPool, create_engine
+
+from .bulk import bulk_insert
+from .restore import dependency_order
+
+RowFactory = Callable[[int], SQLModel | dict]
+
+
+def memory_engine() -> Engine:
+    """
+    :return: Engine for a private in-memory SQLite database, shared between threads through one connection.
+    """
+    return create_engine('sqlite:///:memory:', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+
+
+def fake_value(annotation: Any, i: int) -> Any:
+    """
+    :param annotation: Type of the value, e.g. a field annotation. Pydantic models and containers are filled in
+        recursively.
+    :param i: Row number, varied into the value so rows differ.
+    :return: A value of that type, None for types it doesn't know.
+    """
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin in (Union, types.UnionType):
+        return fake_value(next(_ for _ in args if _ is not type(None)), i)
+    if origin is typing.Annotated:
+        return fake_value(args[0], i)
+    if origin in (list, set, frozenset, Sequence):
+        return (origin if origin is not Sequence else list)([fake_value(args[0] if args else str, i)])
+    if origin is dict:
+        return {fake_value(args[0], i) if args else f'{i}': fake_value(args[1] if args else str, i)}
+    if origin is tuple:
+        if len(args) == 2 and args[1] is Ellipsis:
+            return (fake_value(args[0], i),)
+        return tuple(fake_value(_, i) for _ in args)
+    if not inspect.isclass(annotation):
+        return None
+    if issubclass(annotation, enum.Enum):
+        members = list(annotation)
+        return members[i % len(members)]
+    if issubclass(annotation, BaseModel):
+        return annotation.model_validate(
+            {name: fake_value(field.annotation, i) for name, field in annotation.model_fields.items()}
+        )
+    if issubclass(annotation, bool):
+        return i % 2 == 0
+    if issubclass(annotation, datetime.datetime):
+        return datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i)
+    if issubclass(annotation, datetime.date):
+        return datetime.date(2024, 1, 1) + datetime.timedelta(days=i)
+    for kind, value in ((int, i), (float, i / 2), (str, f'{i}'), (bytes, f'{i}'.encode())):
+        if issubclass(annotation, kind):
+            return value
+    return None
+
+
+def fake_row(model_class: type[SQLModel], i: int, counts: dict[str, int]) -> dict:
+    """
+    :param model_class: SQLModel table class.
+    :param i: Row number, from 0.
+    :param counts: Number of rows per table name, foreign keys point at rows of tables seeded earlier.
+    :return: Column values for row ``i``. Integer primary keys are ``i + 1``, foreign keys cycle through their
+        parent's rows, combinations of foreign keys being distinct so link tables get unique keys.
+    """
+    table = model_class.__table__
+    row = {}
+    stride = 1
+    for name, field in model_class.model_fields.items():
+        column = table.columns.get(name)
+        if column is None:
+            continue
+        foreign_keys = list(column.foreign_keys)
+        if foreign_keys:
+            parents = counts.get(foreign_keys[0].column.table.name, 0)
+            row[name] = (i // stride) % parents + 1 if parents else None
+            stride *= max(parents, 1)
+        elif column.primary_key and column.type.python_type is int:
+            row[name] = i + 1
+        else:
+            row[name] = fake_value(field.annotation, i)
+    return row
+
+
+class TemplateDatabase:
+    """
+    In-memory SQLite database with every table of ``metadata`` created and seeded once, to copy per test.
+
+    :param counts: Number of rows to seed per model. Models are seeded parents first, with :func:`fake_row`
+        unless given a factory, through :func:`pawsql.bulk.bulk_insert`.
+    :param factories: Function per model making row ``i`` as a model instance or dict of column values.
+    :param metadata: Tables to create, defaults to every SQLModel table.
+    """
+
+    def __init__(
+            self,
+            counts: dict[type[SQLModel], int] | None = None,
+            factories: dict[type[SQLModel], RowFactory] | None = None,
+            metadata: MetaData | None = None,
+    ):
+        self.counts = counts or {}
+        self.factories = factories or {}
+        self.metadata = metadata or SQLModel.metadata
+        self.engine = memory_engine()
+        self.metadata.create_all(self.engine)
+        self.seed()
+
+    def seed(self):
+        table_counts = {model_class.__table__.name: count for model_class, count in self.counts.items()}
+        with Session(self.engine) as session:
+            for model_class in dependency_order(self.counts):
+                factory = self.factories.get(model_class)
+                rows = (
+                    factory(i) if factory else fake_row(model_class, i, table_counts)
+                    for i in range(self.counts[model_class])
+                )
+                bulk_insert(session, model_class, rows, batch_size=5000, return_keys=False)
+            session.commit()
+        logger.debug(f'Seeded template database with {sum(self.counts.values())} rows')
+
+    def copy(self) -> Engine:
+        """
+        :return: Engine for a new in-memory database holding a copy of the template.
+        """
+        engine = memory_engine()
+        with self.engine.connect() as source, engine.connect() as target:
+            source.connection.driver_connection.backup(target.connection.driver_connection)
+        return engine
@@ -3,21 +3,59 @@ Import and export SQLModel database session to json once or on a schedule
 """
 from __future__ import annotations
 
-import asyncio
+import contextlib
 import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
+from typing import Any, TypeVar
 
+import sqlalchemy as sqa
 from pydantic.alias_generators import to_snake
-from sqlmodel import SQLModel, Session, select
+from sqlalchemy import Engine, Executable
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlmodel.sql.expression import Select
 from loguru import logger
 
+from .backup_file import BackupReader, Compression, SUFFIXES, atomic_backup
+from .periodic import BackupStats, RunResult, run_guarded, run_periodically
+from .restore import Conflict, RestoreCounts, RestoreProgress, dependency_order, restore_records
+
+T = TypeVar('T', bound=type[SQLModel])
+
 
 class SQLModelBackup:
     """
     Back-up a SQLModel database Session() to JSON file - once, or on a schedule.
 
     :param session: SQLModel session for database operations.
-    :param models: List of SQLModel classes to backup.
+    :param models: List of SQLModel classes to backup. They are backed up and restored parents first,
+        see :func:`pawsql.restore.dependency_order`.
+    :param output_dir: Directory to write backups to and restore from.
+    :param stream: Write and read ``.jsonl`` files one record per line, rather than one JSON document.
+        Rows are read ``chunk_size`` at a time, so memory use does not grow with the database.
+    :param chunk_size: Number of rows to fetch from the database at once when streaming.
+    :param workers: Number of models to dump at once, each on its own connection. To keep the backup consistent,
+        workers read from a point-in-time copy of the database made with SQLite's backup API.
+        Other databases are dumped one model at a time.
+    :param compression: Compress backups with 'gzip' or 'lzma' as they are written. Restore detects compression itself.
+    :param skip_unchanged: Skip scheduled backups when the database hasn't changed since the last one,
+        see :meth:`fingerprint`. Without ``fingerprint_query`` this needs an SQLite database file.
+    :param fingerprint_query: Query whose result changes whenever the data does, e.g. ``SELECT max(updated_at) ...``,
+        to detect changes instead of the default probe.
+
+    Backups are written to a temporary file and renamed over the previous one once synced to disk, and end with a
+    checksum and row counts that :meth:`restore` checks before touching the session, see :mod:`pawsql.backup_file`.
+
+    Scheduled backups run on a dedicated thread so they don't block the event loop, and ``stats`` records every run.
+    Give the backup a session of its own, as it is used from that thread. The thread is started on first use and
+    stopped by :meth:`close`, or on leaving a ``with`` block, or when :meth:`backup_loop` ends.
     """
 
     def __init__(
@@ -25,12 +63,32 @@ class SQLModelBackup:
             session: Session,
             models: list[type(SQLModel)],
             output_dir: Path,
+            stream: bool = False,
+            chunk_size: int = 1000,
+            workers: int = 1,
+            compression: Compression | None = None,
+            skip_unchanged: bool = False,
+            fingerprint_query: str | Executable | None = None,
     ):
         self.session = session
         self.output_dir = output_dir
-        self.json_key_to_model_map = model_map_from_list(models)
-        self.backup_target = self.output_dir / 'backup.json'
-        self.restore_target = self.output_dir / 'restore.json'
+        self.json_key_to_model_map = model_map_from_list(dependency_order(models))
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.compression = compression
+        self.skip_unchanged = skip_unchanged
+        if isinstance(fingerprint_query, str):
+            fingerprint_query = sqa.text(fingerprint_query)
+        self.fingerprint_query = fingerprint_query
+        self.last_fingerprint = None
+        self._probe: sqlite3.Connection | None = None
+        self.stats = BackupStats()
+        self.lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        suffix = 'jsonl' if stream else 'json'
+        self.backup_target = self.output_dir / f'backup.{suffix}{SUFFIXES[compression]}'
+        self.restore_target = self.output_dir / f'restore.{suffix}{SUFFIXES[compression]}'
 
         if self.output_dir.is_file():
             raise FileExistsError('Output directory is a file')
@@ -40,91 +98,457 @@ class SQLModelBackup:
 
         if self.backup_target.is_dir():
             raise NotImplementedError('Backup Target is a directory')
+        if skip_unchanged and fingerprint_query is None:
+            url = self.session.get_bind().url
+            if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+                raise ValueError('skip_unchanged needs a fingerprint_query, except on an SQLite database file')
 
-    async def backup_loop(self, sleep_time: int):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
         """
-        Backup every ``sleep_time`` seconds.
+        Single thread that scheduled and async backups run on, started on first use.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='backup')
+        return self._executor
+
+    def close(self, wait: bool = True):
+        """
+        Stop the backup thread and close the change probe, if started. Using the backup again starts new ones.
+
+        :param wait: Wait for a running backup to finish.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        if self._probe is not None:
+            self._probe.close()
+            self._probe = None
+
+    async def backup_loop(self, sleep_time: int, jitter: float = 0.1, max_backoff: float | None = None):
+        """
+        Backup every ``sleep_time`` seconds, see :func:`pawsql.periodic.run_periodically`.
+        The backup thread is stopped when the loop ends, e.g. is cancelled.
 
         :param sleep_time: Interval in seconds between backup operations.
+        :param jitter: Fraction of the interval to randomly add or remove from each sleep.
+        :param max_backoff: Longest sleep after consecutive failures, defaults to 8 times ``sleep_time``.
         """
         logger.info(f'Initialised, backing up now and every {sleep_time} seconds')
-        while True:
-            logger.debug('Waking')
-            self.backup()
-            logger.debug(f'Sleeping for {sleep_time} seconds')
-            await asyncio.sleep(sleep_time)
+        try:
+            await run_periodically(self.run, sleep_time, self.stats, self.lock, self.executor, jitter, max_backoff)
+        finally:
+            self.close(wait=False)
+
+    async def backup_async(self) -> bool:
+        """
+        Backup once without blocking the event loop, skipped if a backup is already running.
+
+        :returns: True if the backup ran and succeeded.
+        """
+        return await run_guarded(self.run, self.lock, self.stats, self.executor)
+
+    def run(self) -> RunResult | None:
+        """
+        Backup, unless ``self.skip_unchanged`` and the database hasn't changed since the last backup.
+        Then end the session's transaction so the next run reads fresh data.
+
+        :returns: Number of rows and bytes written, None if the backup was skipped.
+        """
+        try:
+            fingerprint = self.fingerprint() if self.skip_unchanged else None
+            if fingerprint is not None and fingerprint == self.last_fingerprint:
+                logger.debug('No changes since the last backup, skipping')
+                return None
+            counts = self.backup() or {}
+        finally:
+            self.session.rollback()
+        self.last_fingerprint = fingerprint
+        return RunResult(sum(counts.values()), self.written_size(counts))
+
+    def fingerprint(self) -> tuple:
+        """
+        Cheap probe of whether the data has changed, taken before each scheduled backup.
+
+        By default that is SQLite's ``PRAGMA data_version``, which changes whenever another connection commits.
+        It is read on a connection of its own, outside the engine's pool, so commits made on any pooled connection,
+        updates included, are seen. Other databases have no such probe and need ``fingerprint_query``, e.g. on an
+        ``updated_at`` column. A query only catches the changes it is written to see.
+
+        :returns: Value that differs from the previous one if the data changed.
+        """
+        if self.fingerprint_query is not None:
+            return tuple(tuple(row) for row in self.session.execute(self.fingerprint_query))
+        return self.probe.execute('PRAGMA data_version').fetchone()
+
+    @property
+    def probe(self) -> sqlite3.Connection:
+        """
+        Connection to the SQLite database outside the engine's pool, opened on first use and closed by :meth:`close`.
+        """
+        if self._probe is None:
+            engine = self.session.get_bind()
+            cargs, cparams = engine.dialect.create_connect_args(engine.url)
+            self._probe = engine.dialect.connect(*cargs, **{**cparams, 'check_same_thread': False})
+        return self._probe
+
+    def written_size(self, counts: dict[str, int]) -> int:
+        """
+        :param counts: Result of the backup just made.
+        :returns: Size in bytes of the file the backup wrote.
+        """
+        return self.backup_target.stat().st_size if self.backup_target.exists() else 0
 
-    def backup(self):
+    def backup(self) -> dict[str, int]:
         """
         Backup ``self.session`` to ``self.backup_target``.
+
+        :returns: Dictionary: {model.__name__ : number of records written}.
         """
+        if self.stream:
+            return self.backup_stream()
+
         backup_d = self.make_backup_dict()
 
         if not backup_d:
             logger.info('No models to backup')
-            return
+            return {}
 
-        with open(self.backup_target, 'w') as f:
-            json.dump(backup_d, f, indent=4)
+        counts = {model: len(records) for model, records in backup_d.items()}
+        with atomic_backup(self.backup_target, self.compression) as f:
+            f.write(json.dumps(backup_d) + '\n')
+            f.rows = counts
         logger.info(
             f'Saved {sum(len(v) for v in backup_d.values())} models to {self.backup_target}',
             category='BACKUP'
         )
+        return counts
 
     def make_backup_dict(self) -> dict:
         """
         :returns: Dictionary: {model.__name__ : [model instances]} in JSON format.
         """
-        json_map = self.json_key_to_model_map
-        session = self.session
-        backup_dict = {
-            model_name_in_json: [_.model_dump_json() for _ in
-                                 session.exec(select(model_class)).all()]
-            for model_name_in_json, model_class in json_map.items()
-        }
+        if self.parallel:
+            def dump(session: Session, model_name_in_json: str, model_class: type[SQLModel]) -> list[str]:
+                return list(self.iter_model_json(model_class, session=session))
+
+            backup_dict = self.parallel_dump(dump)
+        else:
+            json_map = self.json_key_to_model_map
+            session = self.session
+            backup_dict = {
+                model_name_in_json: [_.model_dump_json() for _ in
+                                     session.exec(select(model_class)).all()]
+                for model_name_in_json, model_class in json_map.items()
+            }
         backup_up_model_strs = [f'{len(backup_dict[model])} {model}s' for model in backup_dict if
                                 backup_dict[model]]
         logger.info(f"Dumped {', '.join(backup_up_model_strs)} to json", category='BACKUP')
         return backup_dict
 
-    def restore(self):
+    def iter_model_json(
+            self,
+            model_class: type[SQLModel],
+            query: Select | None = None,
+            session: Session | None = None,
+    ) -> Iterator[str]:
+        """
+        :param model_class: SQLModel class to dump.
+        :param query: Select statement for ``model_class`` rows, defaults to all of them.
+        :param session: Session to read from, defaults to ``self.session``.
+        :returns: JSON string of every row, fetched ``self.chunk_size`` rows at a time.
+        """
+        query = select(model_class) if query is None else query
+        session = session or self.session
+        for model_instance in session.exec(query.execution_options(yield_per=self.chunk_size)):
+            yield model_instance.model_dump_json()
+
+    def backup_stream(self) -> dict[str, int]:
+        """
+        Backup ``self.session`` to ``self.backup_target`` one line per record, see :func:`jsonl_line`.
+
+        :returns: Dictionary: {model.__name__ : number of records written}.
+        """
+        counts = self.write_stream(self.backup_target)
+        backup_up_model_strs = [f'{count} {model}s' for model, count in counts.items() if count]
+        logger.info(
+            f"Streamed {', '.join(backup_up_model_strs) or 'no models'} to {self.backup_target}",
+            category='BACKUP'
+        )
+        return counts
+
+    def write_stream(self, target: Path, queries: dict[str, Select] | None = None) -> dict[str, int]:
+        """
+        Write records to ``target`` one line per record, see :func:`jsonl_line`, then the trailer,
+        see :func:`pawsql.backup_file.atomic_backup`.
+
+        :param target: File to write.
+        :param queries: Select statement per model key, defaults to all rows of every model.
+        :returns: Dictionary: {model.__name__ : number of records written}.
+        """
+        queries = queries or {}
+        if self.parallel:
+            return self.write_stream_parallel(target, queries)
+
+        counts = {}
+        with atomic_backup(target, self.compression) as f:
+            for model_name_in_json, model_class in self.json_key_to_model_map.items():
+                counts[model_name_in_json] = self.write_model_lines(
+                    f, self.session, model_name_in_json, model_class, queries.get(model_name_in_json)
+                )
+            f.rows = counts
+        return counts
+
+    def write_stream_parallel(self, target: Path, queries: dict[str, Select]) -> dict[str, int]:
+        """
+        Write every model to its own part file concurrently, then join the parts into ``target`` in model order.
+        """
+        with tempfile.TemporaryDirectory() as parts_dir:
+            def write_part(session: Session, model_name_in_json: str, model_class: type[SQLModel]) -> int:
+                with open(Path(parts_dir) / model_name_in_json, 'w') as part:
+                    query = queries.get(model_name_in_json)
+                    return self.write_model_lines(part, session, model_name_in_json, model_class, query)
+
+            counts = self.parallel_dump(write_part)
+            with atomic_backup(target, self.compression) as f:
+                for model_name_in_json in self.json_key_to_model_map:
+                    with open(Path(parts_dir) / model_name_in_json) as part:
+                        shutil.copyfileobj(part, f)
+                f.rows = counts
+        return counts
+
+    def write_model_lines(
+            self,
+            f,
+            session: Session,
+            model_name_in_json: str,
+            model_class: type[SQLModel],
+            query: Select | None = None,
+    ) -> int:
+        """
+        :returns: Number of records written to ``f``.
+        """
+        count = 0
+        for record in self.iter_model_json(model_class, query, session):
+            f.write(jsonl_line(model_name_in_json, record))
+            count += 1
+        return count
+
+    @property
+    def parallel(self) -> bool:
+        if self.workers <= 1:
+            return False
+        if self.session.get_bind().dialect.name != 'sqlite':
+            logger.warning('Parallel backup needs a point-in-time copy, only available for SQLite. Dumping serially')
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def snapshot_engine(self) -> Iterator[Engine]:
+        """
+        Copy the database to a temporary file with SQLite's backup API.
+
+        :returns: Engine for the copy, disposed and deleted on exit.
+        """
+        source = self.session.connection().connection.driver_connection
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            path = Path(snapshot_dir) / 'snapshot.db'
+            target = sqlite3.connect(path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+            engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+            try:
+                yield engine
+            finally:
+                engine.dispose()
+
+    def parallel_dump(self, dump: Callable[[Session, str, type[SQLModel]], Any]) -> dict[str, Any]:
+        """
+        Run ``dump(session, model_name_in_json, model_class)`` for every model on ``self.workers`` threads.
+        Each call gets its own session on the same point-in-time copy of the database.
+
+        :returns: Dictionary: {model.__name__ : result of dump}.
+        """
+        with self.snapshot_engine() as engine, ThreadPoolExecutor(self.workers) as pool:
+            def run(model_name_in_json: str, model_class: type[SQLModel]):
+                with Session(engine) as session:
+                    return model_name_in_json, dump(session, model_name_in_json, model_class)
+
+            futures = [pool.submit(run, *_) for _ in self.json_key_to_model_map.items()]
+            return dict(_.result() for _ in futures)
+
+    def load_restore_target(self, verify: bool | None = None) -> dict:
+        """
+        :param verify: Whether to refuse backups without a trailer, see :class:`pawsql.backup_file.BackupReader`.
+        :returns: Dictionary: {model.__name__ : [model instances]} in JSON format, from ``self.restore_target``.
+        :raises BackupIntegrityError: If the backup is incomplete or doesn't match its checksum or row counts.
+        """
+        reader = BackupReader(self.restore_target, verify)
+        if not self.stream:
+            backup_j = json.loads(''.join(reader))
+        else:
+            backup_j = {}
+            for line in reader:
+                json_key, record = read_jsonl_line(line)
+                backup_j.setdefault(json_key, []).append(record)
+        reader.check_rows({json_key: len(records) for json_key, records in backup_j.items()})
+        return backup_j
+
+    def restore(
+            self,
+            conflict: Conflict = 'skip',
+            batch_size: int = 1000,
+            verify: bool | None = None,
+            progress: Callable[[RestoreProgress], None] | None = None,
+    ):
         """
         Restore database from self.restore_target.
+
+        The whole backup is read and checked before the session is touched. Tables are then restored parents first,
+        each record validated, checked against existing primary keys and written ``batch_size`` at a time and
+        committed, see :func:`pawsql.restore.restore_records`.
+        Streamed backups are restored with :meth:`restore_stream`.
+
+        :param conflict: What to do with records already in the database: 'skip', 'overwrite' or 'merge'.
+        :param batch_size: Number of records per batch.
+        :param verify: True to refuse backups without a checksum trailer, e.g. written before trailers existed, None
+            to restore them with a warning, False to restore them silently. Trailers present are always checked.
+        :param progress: Called after every batch of a streamed restore.
         """
+        if self.stream:
+            self.restore_stream(conflict, batch_size, verify, progress)
+            return
+
         try:
-            with open(self.restore_target) as f:
-                backup_j = json.load(f)
+            backup_j = self.load_restore_target(verify)
         except Exception as e:
             logger.error(f'Error loading json: {e}')
             return
 
         for json_key, model_class in self.json_key_to_model_map.items():
-            added = 0
-            for json_string in backup_j.get(json_key):
-                json_record = json.loads(json_string)
-                model_instance = model_class.model_validate(json_record)
-
-                try:
-                    if self.session.get(model_class, model_instance.id):
-                        continue
-
-                except AttributeError:
-                    if self.session.query(model_class).filter_by(**model_instance.dict()).first():
-                        continue
-
-                self.session.add(model_instance)
-                added += 1
-            if added:
+            records = backup_j.pop(json_key, [])
+            counts = restore_records(self.session, model_class, records, conflict, batch_size, commit=True)
+            if counts.added or counts.updated:
+                logger.info(
+                    f'Loaded {counts.added} and updated {counts.updated} {json_key} from {self.restore_target}',
+                    category='BACKUP'
+                )
+
+    def restore_stream(
+            self,
+            conflict: Conflict = 'skip',
+            batch_size: int = 1000,
+            verify: bool | None = None,
+            progress: Callable[[RestoreProgress], None] | None = None,
+    ) -> dict[str, RestoreCounts]:
+        """
+        Restore database from a streamed ``self.restore_target`` in constant memory.
+
+        The file is read twice: once to check its checksum and row counts, then record by record, each record's JSON
+        validated straight from the line by the model's cached adapter and committed ``batch_size`` at a time.
+        Memory use depends on ``batch_size``, not on the size of the backup.
+
+        Tables are restored parents first. Backups list tables in that order, so one pass is enough; backups written
+        in another order, or without a trailer to tell, are read once per table instead.
+
+        :param conflict: What to do with records already in the database: 'skip', 'overwrite' or 'merge'.
+        :param batch_size: Number of records per batch and commit.
+        :param verify: True to refuse backups without a checksum trailer, e.g. written before trailers existed, None
+            to restore them with a warning, False to restore them silently. Trailers present are always checked.
+        :param progress: Called after every batch with the model, records restored so far and the model's total.
+        :returns: Dictionary: {model.__name__ : records added, updated and skipped}.
+        """
+        try:
+            totals = BackupReader(self.restore_target, verify).check().rows or {}
+        except Exception as e:
+            logger.error(f'Error checking backup: {e}')
+            return {}
+
+        order = list(self.json_key_to_model_map)
+        in_file = [json_key for json_key in totals if json_key in self.json_key_to_model_map]
+        in_order = bool(totals) and in_file == sorted(in_file, key=order.index)
+        passes = [set(order)] if in_order else [{json_key} for json_key in order]
+
+        results = {}
+        for wanted in passes:
+            self.restore_pass(wanted, conflict, batch_size, totals, results, progress)
+
+        for json_key, counts in results.items():
+            if counts.added or counts.updated:
                 logger.info(
-                    f'Loaded {added} {json_key} from {self.restore_target}',
+                    f'Loaded {counts.added} and updated {counts.updated} {json_key} from {self.restore_target}',
                     category='BACKUP'
                 )
+        return results
 
-        if self.session.new:
-            self.session.commit()
+    def restore_pass(
+            self,
+            wanted: set[str],
+            conflict: Conflict,
+            batch_size: int,
+            totals: dict[str, int],
+            results: dict[str, RestoreCounts],
+            progress: Callable[[RestoreProgress], None] | None,
+    ):
+        """
+        Read the streamed backup once, restoring records of the ``wanted`` models, and add their counts to ``results``.
+        """
+        lines = (split_jsonl_line(_) for _ in BackupReader(self.restore_target, verify=False))
+        for json_key, group in groupby(lines, key=itemgetter(0)):
+            model_class = self.json_key_to_model_map.get(json_key)
+            if model_class is None or json_key not in wanted:
+                continue
+            done = sum(results.get(json_key, RestoreCounts()))
+
+            def on_batch(counts: RestoreCounts, json_key=json_key):
+                nonlocal done
+                done += sum(counts)
+                logger.debug(f'Restored {done} of {totals.get(json_key, "?")} {json_key}')
+                if progress is not None:
+                    progress(RestoreProgress(json_key, done, totals.get(json_key)))
+
+            records = (record for _, record in group)
+            counts = restore_records(self.session, model_class, records, conflict, batch_size, True, on_batch)
+            results[json_key] = results.get(json_key, RestoreCounts()) + counts
+
+
+def jsonl_line(model_name_in_json: str, record: str) -> str:
+    """
+    :param model_name_in_json: Key of the model in ``json_key_to_model_map``.
+    :param record: JSON string of one model instance.
+    :returns: One line of a streamed backup: ``{"model": model_name_in_json, "record": {...}}``.
+    """
+    return f'{{"model": {json.dumps(model_name_in_json)}, "record": {record}}}\n'
+
+
+def split_jsonl_line(line: str) -> tuple[str, str]:
+    """
+    :returns: Model key and record JSON string from one line of a streamed backup, without decoding the record.
+    """
+    prefix, _, rest = line.partition(', "record": ')
+    if prefix.startswith('{"model": ') and rest.endswith('}\n'):
+        return json.loads(prefix[len('{"model": '):]), rest[:-2]
+    json_key, record = read_jsonl_line(line)
+    return json_key, json.dumps(record)
+
+
+def read_jsonl_line(line: str) -> tuple[str, dict]:
+    """
+    :returns: Model key and decoded record from one line of a streamed backup.
+    """
+    data = json.loads(line)
+    return data['model'], data['record']
 
 
-def model_map_from_list[T:type[SQLModel]](models: list[T]) -> dict[str, T]:
+def model_map_from_list(models: list[T]) -> dict[str, T]:
     """
     :param models: A list of SQLModel classes.
     :returns: A dictionary mapping model.__name__ to type(model).
@@ -1,13 +1,80 @@
 from __future__ import annotations
 
-from collections.abc import Sequence, Sized
-from functools import lru_cache
+import asyncio
+import itertools
+from collections.abc import Iterable, Sequence, Sized
 
 import sqlalchemy as sqa
 from loguru import logger
 from pydantic import BaseModel
 from pydantic.alias_generators import to_snake
-from sqlmodel import SQLModel
+from sqlalchemy.orm import MANYTOMANY, ONETOMANY, RelationshipProperty, joinedload, selectinload
+from sqlalchemy.sql.base import ExecutableOption
+from sqlmodel import SQLModel, Session, select
+from sqlmodel.sql.expression import Select
+
+from .bulk import batches
+
+
+class RelationshipRegistry:
+    """
+    Relationship properties between SQLModel classes, read from their mappers once per class rather than looked up
+    by attribute name on every call. Holds classes only, never instances.
+
+    Where a class has several relationships to the same target, the one named ``<target in snake case>s`` wins,
+    then the first collection, then the first relationship.
+
+    :param models: Classes to introspect now, others are introspected on first use.
+    """
+
+    def __init__(self, models: Iterable[type[SQLModel]] = ()):
+        self.by_source: dict[type[SQLModel], dict[type, RelationshipProperty]] = {}
+        for model in models:
+            self.relationships(model)
+
+    def relationships(self, source: type[SQLModel]) -> dict[type, RelationshipProperty]:
+        """
+        :return: Dictionary: {target class : relationship property of ``source`` pointing at it}.
+        """
+        found = self.by_source.get(source)
+        if found is None:
+            found = self.by_source[source] = self.introspect(source)
+        return found
+
+    @staticmethod
+    def introspect(source: type[SQLModel]) -> dict[type, RelationshipProperty]:
+        by_target: dict[type, list[RelationshipProperty]] = {}
+        for prop in sqa.inspect(source).relationships:
+            by_target.setdefault(prop.mapper.class_, []).append(prop)
+
+        def preference(prop: RelationshipProperty) -> tuple[bool, bool]:
+            return prop.key != f'{to_snake(prop.mapper.class_.__name__)}s', not prop.uselist
+
+        return {target: min(props, key=preference) for target, props in by_target.items()}
+
+    def relationship(self, source: type[SQLModel], target: type[SQLModel]) -> RelationshipProperty:
+        """
+        :raises KeyError: If ``source`` has no relationship to ``target``.
+        """
+        try:
+            return self.relationships(source)[target]
+        except KeyError:
+            raise KeyError(f'{source.__name__} has no relationship to {target.__name__}') from None
+
+    def related(self, instance: SQLModel, target: type[SQLModel]):
+        """
+        :return: Value of ``instance``'s relationship to ``target``, a list for collections.
+        """
+        return getattr(instance, self.relationship(type(instance), target).key)
+
+    def targets(self, source: type[SQLModel], models: Iterable[type[SQLModel]]) -> list[RelationshipProperty]:
+        """
+        :return: ``source``'s relationships to each of ``models`` other than itself.
+        """
+        return [self.relationship(source, model) for model in models if not issubclass(source, model)]
+
+
+RELATIONSHIPS = RelationshipRegistry()
 
 
 def assign_rel(instance: SQLModel, model: type[SQLModel], matches: list[SQLModel]) -> None:
@@ -31,17 +98,37 @@ def assign_rel(instance: SQLModel, model: type[SQLModel], matches: list[SQLModel
 
 
 def related_from_snakenames(instance, model):
-    return getattr(instance, f'{to_snake(model.__name__)}s')
+    """
+    :return: Value of ``instance``'s relationship to ``model``, see :class:`RelationshipRegistry`.
+    """
+    return RELATIONSHIPS.related(instance, model)
 
 
-async def assign_all(instance: SQLModel, matches_d: dict[str, list[SQLModel]]) -> None:
+async def assign_all(
+        instance: SQLModel,
+        matches_d: dict[str, list[SQLModel]],
+        session: Session | None = None,
+        in_thread: bool = False,
+) -> None:
     """
     Assign all matches to an instance
 
     :param instance: instance to assign to
     :param matches_d: dict of matches
+    :param session: Session holding ``instance``. If given, links are written in bulk with :func:`link_all`
+        rather than appended to relationship collections. Matches not yet in the session are added to it, as the
+        relationship cascade would.
+    :param in_thread: Link in a worker thread so the event loop isn't blocked. The session is then used from that
+        thread, don't use it elsewhere until this returns.
     :return: None
     """
+    if session is not None:
+        if in_thread:
+            await asyncio.to_thread(link_all, session, instance, matches_d)
+        else:
+            link_all(session, instance, matches_d)
+        return
+
     for group_name, matches in matches_d.items():
         if not matches:
             continue
@@ -49,6 +136,167 @@ async def assign_all(instance: SQLModel, matches_d: dict[str, list[SQLModel]]) -
         assign_rel(instance, model, matches)
 
 
+def link_all(
+        session: Session,
+        instance: SQLModel,
+        matches_d: dict[str, list[SQLModel]],
+        batch_size: int = 1000,
+        commit: bool = False,
+) -> int:
+    """
+    Link every match to an instance, writing association rows directly rather than through relationship collections,
+    which would load the whole existing collection and insert one row at a time.
+
+    Many-to-many links are inserted with one executemany per batch, skipping links that exist already, found with one
+    query per batch. One-to-many links are set with one UPDATE per batch. Other relationships are assigned as usual.
+    Relationship attributes the links make stale are expired, to be reloaded on next access.
+
+    :param session: Session holding ``instance``. ``instance`` and matches not yet in it are added, then pending
+        objects are flushed to get their keys.
+    :param instance: instance to link to
+    :param matches_d: dict of matches, each list holding instances of one model
+    :param batch_size: Number of matches per statement.
+    :param commit: Commit once all links are written.
+    :return: Number of links written.
+    """
+    unsaved = [_ for _ in (instance, *itertools.chain(*matches_d.values())) if sqa.inspect(_).transient]
+    session.add_all(unsaved)
+    if session.new:
+        session.flush()
+    written = 0
+    for matches in matches_d.values():
+        if not matches:
+            continue
+        model = matches[0].__class__
+        if isinstance(instance, model):
+            logger.warning(f'Instance is same type as model: {instance.__class__.__name__}')
+            continue
+        relationship = RELATIONSHIPS.relationship(type(instance), model)
+        if relationship.direction is MANYTOMANY:
+            written += link_secondary(session, instance, relationship, matches, batch_size)
+        elif relationship.direction is ONETOMANY:
+            written += link_children(session, instance, relationship, matches, batch_size)
+        else:
+            assign_rel(instance, model, matches)
+            continue
+        expire_links(session, instance, relationship, matches)
+
+    if commit:
+        session.commit()
+    return written
+
+
+def column_value(obj: SQLModel, column: sqa.Column):
+    """
+    :return: Value of ``column`` on ``obj``, taken from its identity for primary keys so expired objects aren't
+        refreshed one query at a time.
+    """
+    state = sqa.inspect(obj)
+    if state.identity is not None:
+        for position, pk_column in enumerate(state.mapper.primary_key):
+            if pk_column is column:
+                return state.identity[position]
+    return getattr(obj, state.mapper.get_property_by_column(column).key)
+
+
+def in_keys(columns: list[sqa.Column], keys: list[tuple]) -> sqa.ColumnElement[bool]:
+    if len(columns) == 1:
+        return columns[0].in_([_[0] for _ in keys])
+    return sqa.tuple_(*columns).in_(keys)
+
+
+def link_secondary(
+        session: Session,
+        instance: SQLModel,
+        relationship: RelationshipProperty,
+        matches: list[SQLModel],
+        batch_size: int,
+) -> int:
+    """
+    Insert the association rows linking ``instance`` to ``matches`` that don't exist yet.
+    """
+    secondary = relationship.secondary
+    parent = {link_col: column_value(instance, col) for col, link_col in relationship.synchronize_pairs}
+    parent_values = {link_col.key: value for link_col, value in parent.items()}
+    is_parent = sqa.and_(*(link_col == value for link_col, value in parent.items()))
+    child_pairs = relationship.secondary_synchronize_pairs
+    child_cols = [link_col for _, link_col in child_pairs]
+
+    written = 0
+    for batch in batches(matches, batch_size):
+        keys = list(dict.fromkeys(tuple(column_value(match, col) for col, _ in child_pairs) for match in batch))
+        query = sqa.select(*child_cols).where(is_parent, in_keys(child_cols, keys))
+        existing = {tuple(_) for _ in session.execute(query)}
+        rows = [
+            {**parent_values, **{col.key: value for col, value in zip(child_cols, key)}}
+            for key in keys if key not in existing
+        ]
+        if rows:
+            session.execute(sqa.insert(secondary), rows)
+        written += len(rows)
+    logger.debug(f'Linked {written} {relationship.key} to {instance.__class__.__name__}')
+    return written
+
+
+def link_children(
+        session: Session,
+        instance: SQLModel,
+        relationship: RelationshipProperty,
+        matches: list[SQLModel],
+        batch_size: int,
+) -> int:
+    """
+    Point the foreign keys of ``matches`` at ``instance``.
+    """
+    target = relationship.mapper.local_table
+    values = {child_col.key: column_value(instance, col) for col, child_col in relationship.synchronize_pairs}
+    pk = list(relationship.mapper.primary_key)
+    written = 0
+    for batch in batches(matches, batch_size):
+        keys = [tuple(column_value(_, col) for col in pk) for _ in batch]
+        written += session.execute(sqa.update(target).where(in_keys(pk, keys)).values(values)).rowcount
+    return written
+
+
+def expire_links(session: Session, instance: SQLModel, relationship: RelationshipProperty, matches: list[SQLModel]):
+    """
+    Expire ``instance``'s relationship and the reverse relationship of ``matches``, where loaded.
+    """
+    if relationship.key not in sqa.inspect(instance).unloaded:
+        session.expire(instance, [relationship.key])
+    stale = [relationship.back_populates] if relationship.back_populates else []
+    if relationship.direction is ONETOMANY:
+        stale += [relationship.mapper.get_property_by_column(col).key for _, col in relationship.synchronize_pairs]
+    for match in matches:
+        state = sqa.inspect(match)
+        loaded = [key for key in stale if key not in state.unloaded]
+        if state.session is session and loaded:
+            session.expire(match, loaded)
+
+
+def eager_options(model: type[SQLModel], related_models: Iterable[type[SQLModel]]) -> list[ExecutableOption]:
+    """
+    Loader options fetching ``model``'s relationships to ``related_models`` with the objects themselves, so reading
+    them takes a fixed number of queries rather than one per object per relationship.
+    Collections use ``selectinload``, one extra query each, single objects use ``joinedload``, joined into the query.
+
+    :param model: Model being queried.
+    :param related_models: Models whose related objects will be read, ``model`` itself is ignored.
+    :return: Options for ``select(model).options(...)``.
+    """
+    return [
+        selectinload(getattr(model, prop.key)) if prop.uselist else joinedload(getattr(model, prop.key))
+        for prop in RELATIONSHIPS.targets(model, related_models)
+    ]
+
+
+def select_related(model: type[SQLModel], related_models: Iterable[type[SQLModel]]) -> Select:
+    """
+    :return: Select of ``model`` loading its relationships to ``related_models`` eagerly, see :func:`eager_options`.
+    """
+    return select(model).options(*eager_options(model, related_models))
+
+
 def matches_str(matches: Sized, model: type):
     """
     :param matches: A list of model instances.
@@ -59,24 +307,28 @@ def matches_str(matches: Sized, model: type):
     return f"{matches} '{model.__name__}' {'match' if matches == 1 else 'matches'}"
 
 
-def model_map_(models: Sequence[SQLModel]) -> dict[str, SQLModel]:
+def model_map_(models: Sequence[SQLModel], source: type[SQLModel] | None = None) -> dict[str, SQLModel]:
     """
     Get a map of model names to models
 
     :param models: models to map
+    :param source: Name models after ``source``'s relationships to them, see :class:`RelationshipRegistry`,
+        so the names are attributes of ``source``. Without it models are named ``<snake case name>s``,
+        the names used as backup keys, which need not match any relationship.
     :return: dict of model names to models
     """
+    if source is not None:
+        return {prop.key: prop.mapper.class_ for prop in RELATIONSHIPS.targets(source, models)}
     return {f'{to_snake(_.__name__)}s': _ for _ in models}
 
 
-@lru_cache
-def get_other_table_names(obj, data_models) -> list[str]:
+def get_other_table_names(obj, data_models) -> list:
     """
-    Get the names of all tables that are not the table of an object
+    Get the related objects of an object in every table that is not its own
 
     :param obj: object to check
     :param data_models: models to check
-    :return: list of table names
+    :return: list of related objects per model
     """
-    return [related_from_snakenames(obj, _) for _ in data_models if not isinstance(obj, _)]
+    return [getattr(obj, _.key) for _ in RELATIONSHIPS.targets(type(obj), data_models)]
 
@@ -2,10 +2,99 @@
 pytest fixtures for sqlmodel
 """
 import contextlib
+import re
+import time
+from collections import Counter
+from collections.abc import Iterator
+from typing import NamedTuple
 
 import pytest
+import sqlalchemy as sqa
+from sqlalchemy import Engine
 from sqlmodel import Session, SQLModel, StaticPool, create_engine
 
+from .seed import TemplateDatabase
+
+
+class Query(NamedTuple):
+    statement: str
+    executemany: bool
+    duration: float
+
+
+class QueryLog:
+    """
+    Statements run on an engine while recording, see :func:`record_queries`.
+    """
+
+    def __init__(self):
+        self.queries: list[Query] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        return sum(_.duration for _ in self.queries)
+
+    def shapes(self) -> Counter:
+        """
+        :return: Number of statements of each shape, statements differing only in parameters or literals being alike.
+        """
+        return Counter(query_shape(_.statement) for _ in self.queries)
+
+    def repeated(self, threshold: int = 2) -> dict[str, int]:
+        """
+        :return: Shapes run at least ``threshold`` times, the mark of N+1 queries.
+        """
+        return {shape: count for shape, count in self.shapes().items() if count >= threshold}
+
+    def assert_at_most(self, count: int):
+        assert self.count <= count, f'{self.count} queries, expected at most {count}:\n{self}'
+
+    def assert_no_repeats(self, threshold: int = 2):
+        repeated = self.repeated(threshold)
+        assert not repeated, 'Repeated queries, N+1?\n' + '\n'.join(f'{n} x {q}' for q, n in repeated.items())
+
+    def clear(self):
+        self.queries.clear()
+
+    def __str__(self):
+        return '\n'.join(f'{_.duration * 1000:.2f}ms {_.statement}' for _ in self.queries)
+
+
+def query_shape(statement: str) -> str:
+    statement = ' '.join(statement.split())
+    statement = re.sub(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,?)+\)', '(?)', statement)
+    statement = re.sub(r"'[^']*'", '?', statement)
+    return re.sub(r'\b\d+\b', '?', statement)
+
+
+@contextlib.contextmanager
+def record_queries(engine: Engine) -> Iterator[QueryLog]:
+    """
+    Record every statement run on ``engine`` in the block, with its duration.
+
+    :return: The log, filled in as statements run.
+    """
+    log = QueryLog()
+    started = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        started.append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        log.queries.append(Query(statement, executemany, time.perf_counter() - started.pop()))
+
+    sqa.event.listen(engine, 'before_cursor_execute', before)
+    sqa.event.listen(engine, 'after_cursor_execute', after)
+    try:
+        yield log
+    finally:
+        sqa.event.remove(engine, 'before_cursor_execute', before)
+        sqa.event.remove(engine, 'after_cursor_execute', after)
+
 
 @pytest.fixture(scope='function')
 def engine_fxt():
@@ -30,3 +119,56 @@ def session_fxt():
     with Session(engine) as session:
         yield session
 
+
+@pytest.fixture(scope='function')
+def query_log_fxt(engine_fxt):
+    """
+    Record statements run on ``engine_fxt`` during the test
+
+    :return: query log, see :class:`QueryLog`
+    """
+    with record_queries(engine_fxt) as log:
+        yield log
+
+
+@pytest.fixture(scope='session')
+def template_counts_fxt() -> dict[type[SQLModel], int]:
+    """
+    Rows to seed the template database with, override to seed models
+
+    :return: dict of model classes to row counts
+    """
+    return {}
+
+
+@pytest.fixture(scope='session')
+def template_db_fxt(template_counts_fxt):
+    """
+    Create and seed a template database, once per test session
+
+    :return: template database, see :class:`pawsql.seed.TemplateDatabase`
+    """
+    return TemplateDatabase(template_counts_fxt)
+
+
+@pytest.fixture(scope='function')
+def template_engine_fxt(template_db_fxt):
+    """
+    Copy the template database with SQLite's backup API
+
+    :return: sqlite engine for the copy
+    """
+    engine = template_db_fxt.copy()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope='function')
+def template_session_fxt(template_engine_fxt):
+    """
+    Open a session on a copy of the template database
+
+    :return: sqlite session
+    """
+    with Session(template_engine_fxt) as session:
+        yield session
@@ -0,0 +1,169 @@
+"""
+Build models from trusted JSON (written by :class:`PydanticJSONColumn` itself) without validating it
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import types
+import typing as _t
+from contextvars import ContextVar
+from enum import Enum
+from functools import cache
+
+from pydantic import BaseModel, TypeAdapter
+
+#: Set ``PAWSQL_TRUSTED_DEBUG=1`` to fully validate trusted reads, e.g. to find data the trusted path mishandles.
+TRUSTED_DEBUG = bool(os.environ.get('PAWSQL_TRUSTED_DEBUG'))
+
+_trusted: ContextVar[bool | None] = ContextVar('pawsql_trusted', default=None)
+
+_IDENTITY = (_t.Any, object, str, int, float, bool, type(None), list, dict)
+
+
+@contextlib.contextmanager
+def trusted_reads(enabled: bool = True):
+    """
+    Override the ``trusted`` setting of every :class:`PydanticJSONColumn` read inside the block, e.g. per session.
+
+    :param enabled: True to skip validation, False to force it.
+    """
+    token = _trusted.set(enabled)
+    try:
+        yield
+    finally:
+        _trusted.reset(token)
+
+
+def is_trusted(column_trusted: bool) -> bool:
+    """
+    :param column_trusted: The column's own ``trusted`` setting.
+    :return: Whether to read values with :func:`construct` rather than full validation.
+    """
+    if TRUSTED_DEBUG:
+        return False
+    override = _trusted.get()
+    return column_trusted if override is None else override
+
+
+def construct(model_class: type[BaseModel], data: str | bytes | dict) -> BaseModel:
+    """
+    Build ``model_class`` from trusted data, a JSON string or a dict as produced by ``model_dump(mode='json')``.
+    """
+    if isinstance(data, str | bytes):
+        data = json.loads(data)
+    return trusted_builder(model_class)(data)
+
+
+@cache
+def trusted_builder(model_class: type[BaseModel]) -> _t.Callable[[dict], BaseModel]:
+    """
+    Compile a function building ``model_class`` from a trusted dict, once per model.
+
+    Nested models, enums, tuples, sets and optional values are converted from their JSON form,
+    other types that JSON can't hold natively (e.g. datetimes) are validated by a per-field TypeAdapter.
+    Values are otherwise used as they are, skipping validators and constraints.
+
+    :param model_class: The pydantic model to build.
+    :return: Callable taking a dict of field values (by name or alias) and returning a model instance.
+    """
+    fields = model_class.model_fields
+    aliases = {_.alias: name for name, _ in fields.items() if _.alias and _.alias != name}
+    converters = {name: conv for name, _ in fields.items() if (conv := converter(_.annotation)) is not None}
+    defaults = {name: _ for name, _ in fields.items() if not _.is_required()}
+    plain = (
+            not model_class.__private_attributes__
+            and model_class.model_config.get('extra') != 'allow'
+            and not model_class.__pydantic_post_init__
+    )
+    new = object.__new__
+    setattr_ = object.__setattr__
+
+    def build(data: dict) -> BaseModel:
+        values = {aliases.get(key, key): value for key, value in data.items()} if aliases else dict(data)
+        fields_set = set(values)
+        for name, convert in converters.items():
+            if name in values:
+                values[name] = convert(values[name])
+        for name, field in defaults.items():
+            if name not in values:
+                values[name] = field.get_default(call_default_factory=True)
+        if not plain:
+            return model_class.model_construct(fields_set, **values)
+        instance = new(model_class)
+        setattr_(instance, '__dict__', values)
+        setattr_(instance, '__pydantic_fields_set__', fields_set)
+        setattr_(instance, '__pydantic_extra__', None)
+        setattr_(instance, '__pydantic_private__', None)
+        return instance
+
+    return build
+
+
+def converter(annotation) -> _t.Callable | None:
+    """
+    :param annotation: A field annotation.
+    :return: Callable converting the JSON form of a value to ``annotation``, or None if no conversion is needed.
+    """
+    origin = _t.get_origin(annotation)
+    args = _t.get_args(annotation)
+
+    if annotation in _IDENTITY or origin is _t.Literal:
+        return None
+    elif origin is _t.Annotated:
+        return converter(args[0])
+    elif annotation is tuple:
+        return tuple
+    elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return trusted_builder(annotation)
+    elif isinstance(annotation, type) and issubclass(annotation, Enum):
+        return annotation
+    elif origin in (_t.Union, types.UnionType):
+        return optional_converter(annotation, args)
+    elif origin in (list, set, frozenset):
+        return sequence_converter(origin, args[0] if args else _t.Any)
+    elif origin is tuple:
+        return tuple_converter(args)
+    elif origin is dict:
+        return dict_converter(*(args or (_t.Any, _t.Any)))
+    return TypeAdapter(annotation).validate_python
+
+
+def optional_converter(annotation, args) -> _t.Callable | None:
+    arms = [_ for _ in args if _ is not type(None)]
+    if len(arms) != 1:
+        return TypeAdapter(annotation).validate_python
+    convert = converter(arms[0])
+    if convert is None:
+        return None
+    return lambda value: None if value is None else convert(value)
+
+
+def sequence_converter(origin: type, item) -> _t.Callable | None:
+    convert = converter(item)
+    if convert is None:
+        return None if origin is list else origin
+    if origin is list:
+        return lambda value: [convert(_) for _ in value]
+    return lambda value: origin(convert(_) for _ in value)
+
+
+def tuple_converter(args) -> _t.Callable:
+    if not args or (len(args) == 2 and args[1] is Ellipsis):
+        convert = converter(args[0]) if args else None
+        if convert is None:
+            return tuple
+        return lambda value: tuple(convert(_) for _ in value)
+    converters = [converter(_) or (lambda v: v) for _ in args]
+    return lambda value: tuple(convert(_) for convert, _ in zip(converters, value))
+
+
+def dict_converter(key, item) -> _t.Callable | None:
+    convert_key = converter(key)
+    convert = converter(item)
+    if convert_key is None and convert is None:
+        return None
+    convert_key = convert_key or (lambda v: v)
+    convert = convert or (lambda v: v)
+    return lambda value: {convert_key(k): convert(v) for k, v in value.items()}
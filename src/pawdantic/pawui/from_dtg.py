@@ -5,10 +5,12 @@ from typing import Sequence, Union
 from fastui import components as c, events
 from fastui.events import GoToEvent
 from loguru import logger
+from sqlmodel import Session
 
 import suppawt.convert
 from DecodeTheBot.dtg_types import DB_MODELS
 from DecodeTheBot.ui.dtg_styles import HEAD, SUB_LIST, TITLE_COL, PLAY_COL
+from pawdantic.pawsql.sqlpr import RELATIONSHIPS, select_related
 from pawdantic.pawui import builders, styles
 from suppawt import get_values, convert
 
@@ -42,6 +44,14 @@ def objects_ui_with(objects: Sequence) -> c.Div:
         logger.error(e)
 
 
+def model_objects_ui(session: Session, model) -> c.Div:
+    """
+    :func:`objects_ui_with` for every ``model`` row, fetched with :func:`select_with_related` so the related objects
+    shown are loaded in one query per type rather than one per object per type.
+    """
+    return objects_ui_with(session.exec(select_with_related(model)).unique().all())
+
+
 def objects_col(objects: Sequence) -> c.Div:
     try:
         if not objects:
@@ -75,10 +85,18 @@ def get_typs() -> list[str]:
 
 
 def get_related_typs(obj) -> list[str]:
-    typs = [f"{get_set.to_snake(_.__name__)}s" for _ in DB_MODELS if not isinstance(obj, _)]
+    typs = [_.key for _ in RELATIONSHIPS.targets(type(obj), DB_MODELS)]
     return typs
 
 
+def select_with_related(model):
+    """
+    Query for objects shown with :func:`objects_ui_with`, loading the related objects of every type in one go
+    rather than one query per object per type.
+    """
+    return select_related(model, DB_MODELS)
+
+
 def _object_ui_with_related(obj) -> list[tuple[str, c.Div]]:
     out_list = [
         (
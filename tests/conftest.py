@@ -1,18 +1,35 @@
 import pytest
-from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel import Session
 
-from tests.models import Alert, AlertType, TestModel, TestModelOptionalJson, TestModelRequiredJson
+from pawdantic.pawsql.seed import TemplateDatabase
+
+from tests.models import (
+    Alert,
+    AlertType,
+    TestModel,
+    TestModelBinary,
+    TestModelNativeJson,
+    TestModelOptionalJson,
+    TestModelRequiredJson,
+)
+
+pytest_plugins = ['pawdantic.pawsql.sqlpr_test']
 
 DB_FILE = 'sqlite:///test.db'
 DB_MEMORY = 'sqlite:///:memory:'
 
 
+@pytest.fixture(scope='session')
+def schema_template():
+    return TemplateDatabase()
+
+
 @pytest.fixture(scope='function')
-def test_session():
-    engine = create_engine(DB_MEMORY)
-    SQLModel.metadata.create_all(engine)
+def test_session(schema_template):
+    engine = schema_template.copy()
     with Session(engine) as session:
         yield session
+    engine.dispose()
 
 
 @pytest.fixture
@@ -25,7 +42,7 @@ def test_model(alert_fxt):
     return TestModel(
         alert=alert_fxt,
         alerts_list=[alert_fxt],
-        alerts_dict={"alert1": alert_fxt},
+        alerts_dict={'alert1': alert_fxt},
         alerts_tuple=(alert_fxt, alert_fxt),
     )
 
@@ -35,7 +52,27 @@ def test_model_required_json(alert_fxt):
     return TestModelRequiredJson(
         alert=alert_fxt,
         alerts_list=[alert_fxt],
-        alerts_dict={"alert1": alert_fxt},
+        alerts_dict={'alert1': alert_fxt},
+        alerts_tuple=(alert_fxt, alert_fxt),
+    )
+
+
+@pytest.fixture
+def test_model_native_json(alert_fxt):
+    return TestModelNativeJson(
+        alert=alert_fxt,
+        alerts_list=[alert_fxt],
+        alerts_dict={'alert1': alert_fxt},
+        alerts_tuple=(alert_fxt, alert_fxt),
+    )
+
+
+@pytest.fixture
+def test_model_binary(alert_fxt):
+    return TestModelBinary(
+        alert=alert_fxt,
+        alerts_list=[alert_fxt],
+        alerts_dict={'alert1': alert_fxt},
         alerts_tuple=(alert_fxt, alert_fxt),
     )
 
@@ -45,7 +82,7 @@ def test_model_optional_json_provided(alert_fxt):
     return TestModelOptionalJson(
         alert=alert_fxt,
         alerts_list=[alert_fxt],
-        alerts_dict={"alert1": alert_fxt},
+        alerts_dict={'alert1': alert_fxt},
         alerts_tuple=(alert_fxt, alert_fxt),
     )
 
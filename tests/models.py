@@ -1,9 +1,16 @@
 from enum import StrEnum
 from pydantic import BaseModel
 from sqlalchemy import Column
-from sqlmodel import Field, SQLModel
+from sqlmodel import Field, Relationship, SQLModel
 
-from pawdantic.pawsql import optional_json_field, required_json_field, PydanticJSONColumn
+from pawdantic.pawsql import (
+    PydanticJSONColumn,
+    optional_binary_field,
+    optional_json_field,
+    required_binary_field,
+    required_json_field,
+)
+from pawdantic.pawsql.json_query import json_index, json_path
 
 
 class AlertType(StrEnum):
@@ -47,3 +54,74 @@ class TestModelOptionalJson(SQLModel, table=True):
     alerts_list: list[Alert] = optional_json_field(Alert)
     alerts_dict: dict[str, Alert] = optional_json_field(Alert)
     alerts_tuple: tuple[Alert, ...] = optional_json_field(Alert)
+
+
+class TestModelNativeJson(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    alert: Alert = required_json_field(Alert, native=True)
+    alerts_list: list[Alert] = required_json_field(Alert, native=True)
+    alerts_dict: dict[str, Alert] = required_json_field(Alert, native=True)
+    alerts_tuple: tuple[Alert, ...] = required_json_field(Alert, native=True)
+
+
+class TestModelLazyJson(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    alert: Alert = required_json_field(Alert, native=True, lazy=True)
+    alerts_list: list[Alert] = required_json_field(Alert, native=True, lazy=True)
+
+
+class TestModelBinary(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    alert: Alert = required_binary_field(Alert)
+    alerts_list: list[Alert] = required_binary_field(Alert, compress_threshold=0)
+    alerts_dict: dict[str, Alert] = required_binary_field(Alert, compression='lzma', compress_threshold=0)
+    alerts_tuple: tuple[Alert, ...] = optional_binary_field(Alert)
+
+
+class TestModelLazyBinary(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    alert: Alert = required_binary_field(Alert, lazy=True)
+    alerts_list: list[Alert] = required_binary_field(Alert, lazy=True, compress_threshold=0)
+    alerts_dict: dict[str, Alert] = required_binary_field(Alert, lazy=True)
+
+
+class TestModelMutableJson(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    alert: Alert = required_json_field(Alert, native=True, mutable=True)
+    alerts_list: list[Alert] = required_json_field(Alert, native=True, mutable=True)
+    alerts_dict: dict[str, Alert] = required_json_field(Alert, mutable=True)
+    alerts_tuple: tuple[Alert, ...] = required_json_field(Alert, native=True, mutable=True)
+
+
+json_index(json_path(TestModelNativeJson.alert).type)
+
+
+class TestModelCachedJson(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    alert: Alert = required_json_field(Alert, native=True, cache_size=16)
+    alerts_list: list[Alert] = required_json_field(Alert, native=True, cache_size=16)
+
+
+class Team(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str
+    heroes: list['Hero'] = Relationship(back_populates='team')
+
+
+class HeroPowerLink(SQLModel, table=True):
+    hero_id: int | None = Field(default=None, foreign_key='hero.id', primary_key=True)
+    power_id: int | None = Field(default=None, foreign_key='power.id', primary_key=True)
+
+
+class Hero(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str
+    team_id: int | None = Field(default=None, foreign_key='team.id')
+    team: Team | None = Relationship(back_populates='heroes')
+    powers: list['Power'] = Relationship(back_populates='heroes', link_model=HeroPowerLink)
+
+
+class Power(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str
+    heroes: list[Hero] = Relationship(back_populates='powers', link_model=HeroPowerLink)
@@ -0,0 +1,505 @@
+import asyncio
+import json
+import shutil
+import threading
+
+import pytest
+import sqlalchemy as sqa
+from sqlmodel import SQLModel, Session, create_engine
+
+from pawdantic.pawsql.backup_file import BackupIntegrityError, BackupReader
+from pawdantic.pawsql.dedup_backup import DedupBackup
+from pawdantic.pawsql.incremental_backup import IncrementalBackup
+from pawdantic.pawsql.indexed_backup import IndexedBackup
+from pawdantic.pawsql.periodic import BackupStats, RunResult, next_delay, run_guarded
+from pawdantic.pawsql.sqlpr_test import record_queries
+from pawdantic.pawsql.sqlmodel_backup import SQLModelBackup, jsonl_line, split_jsonl_line
+from tests.conftest import DB_MEMORY
+from pawdantic.pawsql.restore import dependency_order
+from tests.models import Alert, Hero, HeroPowerLink, Power, Team, TestModelOptionalJson, TestModelRequiredJson
+
+MODELS = [TestModelRequiredJson]
+
+
+def make_rows(count: int) -> list[TestModelRequiredJson]:
+    return [
+        TestModelRequiredJson(
+            alert=Alert(code=i, message=f'message {i}'),
+            alerts_list=[Alert(code=i, message='list')],
+            alerts_dict={'a': Alert(code=i, message='dict')},
+            alerts_tuple=(),
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def restore_session():
+    engine = create_engine(DB_MEMORY)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def stored(session) -> list[TestModelRequiredJson]:
+    return session.exec(sqa.select(TestModelRequiredJson).order_by(TestModelRequiredJson.id)).scalars().all()
+
+
+def copy_to_restore(backup: SQLModelBackup, restore: SQLModelBackup):
+    shutil.copy(backup.backup_target, restore.restore_target)
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_backup_and_restore(test_session, restore_session, tmp_path, stream):
+    test_session.add_all(make_rows(5))
+    test_session.commit()
+
+    backup = SQLModelBackup(test_session, MODELS, tmp_path / 'backup', stream=stream, chunk_size=2)
+    backup.backup()
+    restore = SQLModelBackup(restore_session, MODELS, tmp_path / 'restore', stream=stream)
+    copy_to_restore(backup, restore)
+    restore.restore()
+
+    assert [_.model_dump() for _ in stored(restore_session)] == [_.model_dump() for _ in stored(test_session)]
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_restore_query_count(test_session, restore_session, tmp_path, stream):
+    test_session.add_all(make_rows(100))
+    test_session.commit()
+    backup = SQLModelBackup(test_session, MODELS, tmp_path / 'backup', stream=stream)
+    backup.backup()
+    restore = SQLModelBackup(restore_session, MODELS, tmp_path / 'restore', stream=stream)
+    copy_to_restore(backup, restore)
+
+    with record_queries(restore_session.get_bind()) as log:
+        restore.restore(batch_size=50)
+    log.assert_at_most(4)
+
+
+def test_streamed_backup_is_line_per_record(test_session, tmp_path):
+    test_session.add_all(make_rows(3))
+    test_session.commit()
+
+    backup = SQLModelBackup(test_session, MODELS, tmp_path, stream=True)
+    assert backup.backup_stream() == {'test_model_required_jsons': 3}
+    lines = backup.backup_target.read_text().splitlines()
+    assert len(lines) == 4
+    assert json.loads(lines[-1])['rows'] == {'test_model_required_jsons': 3}
+
+
+def test_streamed_restore_reports_progress(test_session, restore_session, tmp_path):
+    test_session.add_all(make_rows(5))
+    test_session.commit()
+    backup = SQLModelBackup(test_session, MODELS, tmp_path / 'backup', stream=True)
+    backup.backup()
+    restore = SQLModelBackup(restore_session, MODELS, tmp_path / 'restore', stream=True)
+    copy_to_restore(backup, restore)
+
+    progress = []
+    restore.restore(batch_size=2, progress=progress.append)
+    assert [(_.done, _.total) for _ in progress] == [(2, 5), (4, 5), (5, 5)]
+    assert len(stored(restore_session)) == 5
+
+
+def test_incremental_backup_rejects_nullable_watermark(test_session, tmp_path):
+    with pytest.raises(ValueError, match='nullable'):
+        IncrementalBackup(test_session, [Team, Hero], tmp_path, watermarks={Hero: 'team_id'})
+    backup = IncrementalBackup(test_session, [Team, Hero], tmp_path, watermarks={Hero: 'name'})
+    test_session.add_all([Hero(name='b'), Hero(name='a')])
+    test_session.commit()
+    assert backup.compact() == {'teams': 0, 'heros': 2}
+
+
+def test_split_jsonl_line():
+    line = jsonl_line('alerts', '{"a": "}"}')
+    assert split_jsonl_line(line) == ('alerts', '{"a": "}"}')
+    assert split_jsonl_line('{"record": {"a": 1}, "model": "alerts"}') == ('alerts', '{"a": 1}')
+
+
+def test_incremental_backup(test_session, restore_session, tmp_path):
+    test_session.add_all(make_rows(3))
+    test_session.commit()
+    backup = IncrementalBackup(test_session, MODELS, tmp_path, compact_every=2)
+
+    assert backup.backup() == {'test_model_required_jsons': 3}
+    assert backup.backup() == {'test_model_required_jsons': 0}
+    test_session.add_all(make_rows(2))
+    test_session.commit()
+    assert backup.backup() == {'test_model_required_jsons': 2}
+    assert backup.load_manifest().deltas == ['delta-000002.jsonl']
+
+    IncrementalBackup(restore_session, MODELS, tmp_path).restore()
+    assert len(stored(restore_session)) == 5
+
+    test_session.add_all(make_rows(1))
+    test_session.commit()
+    backup.backup()
+    assert backup.backup() == {'test_model_required_jsons': 6}
+    manifest = backup.load_manifest()
+    assert manifest.deltas == []
+    assert sorted(_.name for _ in backup.backup_dir.iterdir()) == [manifest.base, 'manifest.json']
+
+
+@pytest.mark.parametrize(
+    'conflict, message',
+    [('skip', 'local'), ('overwrite', 'message 0'), ('merge', 'message 0')],
+)
+def test_restore_conflicts(test_session, restore_session, tmp_path, conflict, message):
+    test_session.add_all(make_rows(3))
+    test_session.commit()
+    backup = SQLModelBackup(test_session, MODELS, tmp_path / 'backup')
+    backup.backup()
+
+    local = make_rows(1)[0]
+    local.alert = Alert(code=0, message='local')
+    restore_session.add(local)
+    restore_session.commit()
+    restore = SQLModelBackup(restore_session, MODELS, tmp_path / 'restore')
+    copy_to_restore(backup, restore)
+    restore.restore(conflict=conflict, batch_size=2)
+
+    rows = stored(restore_session)
+    assert len(rows) == 3
+    assert rows[0].alert.message == message
+    assert rows[1].alert.message == 'message 1'
+
+
+def test_restore_merge_keeps_existing_values(restore_session, tmp_path):
+    restore = SQLModelBackup(restore_session, [TestModelOptionalJson], tmp_path)
+    record = {'id': 1, 'alerts_list': [{'message': 'restored'}]}
+    restore.restore_target.write_text(json.dumps({'test_model_optional_jsons': [json.dumps(record)]}))
+    restore_session.add(TestModelOptionalJson(id=1, alert=Alert(message='kept')))
+    restore_session.commit()
+
+    restore.restore(conflict='merge', verify=False)
+    restore_session.expire_all()
+    result = restore_session.get(TestModelOptionalJson, 1)
+    assert result.alert.message == 'kept'
+    assert result.alerts_list == [Alert(message='restored')]
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_parallel_backup(tmp_path, stream):
+    engine = create_engine(f'sqlite:///{tmp_path / "source.db"}')
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(make_rows(4))
+        session.add(TestModelOptionalJson(alert=Alert(message='optional')))
+        session.commit()
+
+        models = [TestModelRequiredJson, TestModelOptionalJson]
+        serial = SQLModelBackup(session, models, tmp_path / 'serial', stream=stream)
+        parallel = SQLModelBackup(session, models, tmp_path / 'parallel', stream=stream, workers=2)
+        serial.backup()
+        parallel.backup()
+
+    assert parallel.backup_target.read_text() == serial.backup_target.read_text()
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'lzma'])
+@pytest.mark.parametrize('stream', [False, True])
+def test_compressed_backup(test_session, restore_session, tmp_path, stream, compression):
+    test_session.add_all(make_rows(20))
+    test_session.commit()
+    backup = SQLModelBackup(test_session, MODELS, tmp_path / 'backup', stream=stream, compression=compression)
+    backup.backup()
+    plain = SQLModelBackup(test_session, MODELS, tmp_path / 'plain', stream=stream)
+    plain.backup()
+    assert backup.backup_target.stat().st_size < plain.backup_target.stat().st_size
+
+    restore = SQLModelBackup(restore_session, MODELS, tmp_path / 'restore', stream=stream)
+    shutil.copy(backup.backup_target, restore.restore_target)
+    restore.restore()
+    assert len(stored(restore_session)) == 20
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_corrupt_backup_is_not_restored(test_session, restore_session, tmp_path, stream):
+    test_session.add_all(make_rows(3))
+    test_session.commit()
+    backup = SQLModelBackup(test_session, MODELS, tmp_path / 'backup', stream=stream)
+    backup.backup()
+    restore = SQLModelBackup(restore_session, MODELS, tmp_path / 'restore', stream=stream)
+    restore.restore_target.write_text(backup.backup_target.read_text().replace('message 1', 'message 9'))
+
+    with pytest.raises(BackupIntegrityError):
+        BackupReader(restore.restore_target).check(line_per_row=stream)
+    restore.restore()
+    assert stored(restore_session) == []
+
+
+def test_backup_without_trailer_is_restored(test_session, restore_session, tmp_path):
+    test_session.add_all(make_rows(3))
+    test_session.commit()
+    restore = SQLModelBackup(restore_session, MODELS, tmp_path)
+    baseline = {'test_model_required_jsons': [_.model_dump_json() for _ in stored(test_session)]}
+    restore.restore_target.write_text(json.dumps(baseline, indent=4))
+
+    restore.restore(verify=True)
+    assert stored(restore_session) == []
+    restore.restore()
+    assert len(stored(restore_session)) == 3
+
+
+def test_failed_backup_keeps_previous(test_session, tmp_path, monkeypatch):
+    test_session.add_all(make_rows(3))
+    test_session.commit()
+    backup = SQLModelBackup(test_session, MODELS, tmp_path, stream=True)
+    backup.backup()
+    previous = backup.backup_target.read_text()
+
+    def fail(*args):
+        raise RuntimeError('crashed mid-write')
+
+    monkeypatch.setattr(backup, 'write_model_lines', fail)
+    with pytest.raises(RuntimeError):
+        backup.backup()
+    assert backup.backup_target.read_text() == previous
+    assert [_.name for _ in tmp_path.iterdir()] == [backup.backup_target.name]
+
+
+def test_dedup_backup_stores_rows_once(test_session, restore_session, tmp_path):
+    test_session.add_all(make_rows(10))
+    test_session.commit()
+    backup = DedupBackup(test_session, MODELS, tmp_path)
+    backup.backup()
+    first_pack = sum(_.stat().st_size for _ in backup.packs_dir.glob('*.pack'))
+    backup.backup()
+    assert sum(_.stat().st_size for _ in backup.packs_dir.glob('*.pack')) == first_pack
+
+    test_session.add_all(make_rows(1))
+    test_session.commit()
+    assert backup.backup() == {'test_model_required_jsons': 11}
+    assert len(list(backup.packs_dir.glob('*.pack'))) == 2
+
+    restore = DedupBackup(restore_session, MODELS, tmp_path)
+    restore.restore(name=backup.snapshots()[0].name)
+    assert len(stored(restore_session)) == 10
+    restore.restore()
+    assert len(stored(restore_session)) == 11
+
+
+def test_dedup_prune_collects_garbage(test_session, tmp_path):
+    test_session.add_all(make_rows(4))
+    test_session.commit()
+    backup = DedupBackup(test_session, MODELS, tmp_path)
+    backup.backup()
+    for row in stored(test_session)[:3]:
+        test_session.delete(row)
+    test_session.commit()
+    backup.backup()
+
+    assert backup.prune(keep=1) > 0
+    assert [_.name for _ in backup.snapshots()] == ['00000002']
+    index = backup.load_index()
+    assert set(index) == set(backup.snapshots()[0].models['test_model_required_jsons'])
+    assert len(list(backup.iter_snapshot(backup.snapshots()[0], 'test_model_required_jsons', index))) == 1
+
+
+def test_dedup_repack_survives_crash(test_session, restore_session, tmp_path, monkeypatch):
+    test_session.add_all(make_rows(4))
+    test_session.commit()
+    backup = DedupBackup(test_session, MODELS, tmp_path)
+    backup.backup()
+    for row in stored(test_session)[:3]:
+        test_session.delete(row)
+    test_session.commit()
+    backup.backup()
+
+    def crash(pack):
+        raise RuntimeError('crashed before deleting the old pack')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(backup, 'delete_pack', crash)
+        with pytest.raises(RuntimeError):
+            backup.prune(keep=1)
+    assert len(list(backup.packs_dir.glob('*.idx'))) == 2
+    (backup.packs_dir / '00000099.pack').write_bytes(b'orphan\n')
+
+    restore = DedupBackup(restore_session, MODELS, tmp_path)
+    restore.restore()
+    assert [_.alert for _ in stored(restore_session)] == [_.alert for _ in stored(test_session)]
+
+    assert backup.collect_garbage() > 0
+    assert sorted(_.name for _ in backup.packs_dir.iterdir()) == ['00000003.idx', '00000003.pack']
+
+
+def foreign_key_engine(path):
+    engine = create_engine(f'sqlite:///{path}')
+    sqa.event.listen(engine, 'connect', lambda connection, _: connection.execute('PRAGMA foreign_keys=ON'))
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def test_dependency_order():
+    assert dependency_order([HeroPowerLink, Hero, Power, Team]) == [Power, Team, Hero, HeroPowerLink]
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_restore_parents_first(tmp_path, stream):
+    models = [HeroPowerLink, Hero, Power, Team]
+    with Session(foreign_key_engine(tmp_path / 'source.db')) as session:
+        team = Team(name='team')
+        session.add(Hero(name='hero', team=team, powers=[Power(name='flight'), Power(name='speed')]))
+        session.commit()
+        backup = SQLModelBackup(session, models, tmp_path / 'backup', stream=stream)
+        backup.backup()
+
+    with Session(foreign_key_engine(tmp_path / 'restore.db')) as session:
+        restore = SQLModelBackup(session, models, tmp_path / 'restore', stream=stream)
+        copy_to_restore(backup, restore)
+        restore.restore(batch_size=1)
+        hero = session.exec(sqa.select(Hero)).scalars().one()
+        assert hero.team.name == 'team'
+        assert sorted(_.name for _ in hero.powers) == ['flight', 'speed']
+
+
+def test_streamed_restore_reorders_old_backups(tmp_path):
+    with Session(foreign_key_engine(tmp_path / 'source.db')) as session:
+        session.add(Hero(name='hero', team=Team(name='team')))
+        session.commit()
+        backup = SQLModelBackup(session, [Team, Hero], tmp_path / 'backup', stream=True)
+        backup.backup()
+    lines = backup.backup_target.read_text().splitlines(keepends=True)
+    backup.backup_target.write_text(''.join(reversed(lines[:-1])))
+
+    with Session(foreign_key_engine(tmp_path / 'restore.db')) as session:
+        restore = SQLModelBackup(session, [Team, Hero], tmp_path / 'restore', stream=True)
+        copy_to_restore(backup, restore)
+        restore.restore(verify=False)
+        assert session.exec(sqa.select(Hero)).scalars().one().team.name == 'team'
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_indexed_backup_restores_selectively(tmp_path, restore_session, workers):
+    engine = create_engine(f'sqlite:///{tmp_path / "source.db"}')
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(make_rows(10))
+        session.add(
+            TestModelOptionalJson(alert=Alert(message='optional'), alerts_list=[], alerts_dict={}, alerts_tuple=())
+        )
+        session.commit()
+        models = [TestModelRequiredJson, TestModelOptionalJson]
+        backup = IndexedBackup(session, models, tmp_path / 'backup', block_size=3, workers=workers)
+        assert backup.backup() == {'test_model_required_jsons': 10, 'test_model_optional_jsons': 1}
+
+    restore = IndexedBackup(restore_session, models, tmp_path / 'restore')
+    copy_to_restore(backup, restore)
+    counts = restore.restore(models=[TestModelRequiredJson], start=4, stop=8)
+
+    assert list(counts) == ['test_model_required_jsons']
+    assert [_.id for _ in stored(restore_session)] == [4, 5, 6, 7, 8]
+    assert stored(restore_session)[0].alert == Alert(code=3, message='message 3')
+
+    restore.restore()
+    assert len(stored(restore_session)) == 10
+    assert restore_session.exec(sqa.select(TestModelOptionalJson)).scalars().one().alert.message == 'optional'
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda data: data[:-4],
+    lambda data: data.replace(b'message 3', b'message 4'),
+    lambda data: data.replace(b'"rows":5', b'"rows":6'),
+])
+def test_indexed_backup_rejects_corrupt_file(test_session, restore_session, tmp_path, corrupt):
+    test_session.add_all(make_rows(5))
+    test_session.commit()
+    backup = IndexedBackup(test_session, MODELS, tmp_path / 'backup')
+    backup.backup()
+    restore = IndexedBackup(restore_session, MODELS, tmp_path / 'restore')
+    restore.restore_target.write_bytes(corrupt(backup.backup_target.read_bytes()))
+
+    assert restore.restore() == {}
+    assert stored(restore_session) == []
+
+
+def test_backup_async_records_stats(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "source.db"}')
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(make_rows(3))
+        session.commit()
+        with SQLModelBackup(session, MODELS, tmp_path / 'backup') as backup:
+            assert asyncio.run(backup.backup_async())
+            thread = next(_ for _ in threading.enumerate() if _.name.startswith('backup'))
+        assert not thread.is_alive()
+
+    assert backup.stats.runs == 1
+    assert backup.stats.last_rows == 3
+    assert backup.stats.last_bytes == backup.backup_target.stat().st_size
+    assert not backup.stats.running
+
+
+@pytest.mark.parametrize('fingerprint_query', [None, 'SELECT max(id) FROM testmodelrequiredjson'])
+def test_unchanged_database_is_not_backed_up(tmp_path, fingerprint_query):
+    engine = create_engine(f'sqlite:///{tmp_path / "source.db"}')
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session, Session(engine) as writer:
+        writer.add_all(make_rows(2))
+        writer.commit()
+        backup = SQLModelBackup(
+            session, MODELS, tmp_path / 'backup', skip_unchanged=True, fingerprint_query=fingerprint_query
+        )
+        assert backup.run().rows == 2
+        assert backup.run() is None
+        writer.add_all(make_rows(1))
+        writer.commit()
+        assert backup.run().rows == 3
+
+        assert asyncio.run(backup.backup_async())
+        assert backup.stats.skipped_unchanged == 1
+        assert backup.stats.runs == 0
+
+
+def test_update_by_other_session_is_backed_up(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "source.db"}')
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session, Session(engine) as writer:
+        writer.add_all(make_rows(2))
+        writer.commit()
+        with SQLModelBackup(session, MODELS, tmp_path / 'backup', skip_unchanged=True) as backup:
+            assert backup.run().rows == 2
+            row = writer.exec(sqa.select(TestModelRequiredJson)).scalars().first()
+            row.alert = Alert(code=99, message='updated')
+            writer.commit()
+            assert backup.run().rows == 2
+            assert backup.run() is None
+    assert 'updated' in backup.backup_target.read_text()
+
+
+def test_skip_unchanged_needs_query_outside_sqlite_files(tmp_path):
+    with Session(create_engine(DB_MEMORY)) as session, pytest.raises(ValueError):
+        SQLModelBackup(session, MODELS, tmp_path, skip_unchanged=True)
+
+
+def test_overlapping_run_is_skipped():
+    lock, stats, release = threading.Lock(), BackupStats(), threading.Event()
+
+    async def main():
+        first = asyncio.create_task(run_guarded(lambda: release.wait() and RunResult(), lock, stats))
+        await asyncio.sleep(0.05)
+        skipped = await run_guarded(RunResult, lock, stats)
+        release.set()
+        return skipped, await first
+
+    assert asyncio.run(main()) == (False, True)
+    assert stats.skipped_overlap == 1
+    assert stats.runs == 1
+
+
+def test_failures_back_off():
+    lock, stats = threading.Lock(), BackupStats()
+
+    def fail():
+        raise RuntimeError('disk full')
+
+    for _ in range(3):
+        assert not asyncio.run(run_guarded(fail, lock, stats))
+
+    assert stats.consecutive_failures == 3
+    assert 'disk full' in stats.last_error
+    assert next_delay(10, stats, jitter=0, max_backoff=60) == 60
+    assert next_delay(10, BackupStats(), jitter=0, max_backoff=60) == 10
+    assert 9 <= next_delay(10, BackupStats(), jitter=0.1, max_backoff=60) <= 11
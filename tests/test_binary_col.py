@@ -0,0 +1,60 @@
+import json
+import warnings
+
+import pytest
+import sqlalchemy as sqa
+
+from pawdantic.pawsql import PydanticBinaryColumn
+from pawdantic.pawsql.binary import CODECS, read_header
+from pawdantic.pawsql.lazy import LazyJSON
+from tests.models import Alert, TestModelLazyBinary
+
+
+def test_compresses_above_threshold(alert_fxt):
+    column = PydanticBinaryColumn(Alert, compress_threshold=256)
+    small = column.process_bind_param(alert_fxt, None)
+    assert read_header(small) == (CODECS['none'], b'm')
+
+    many = [alert_fxt] * 100
+    large = column.process_bind_param(many, None)
+    assert read_header(large) == (CODECS['zlib'], b'l')
+    assert len(large) < len(''.join(_.model_dump_json() for _ in many))
+    assert column.process_result_value(large, None) == many
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+def test_round_trip_shapes(alert_fxt, compression):
+    column = PydanticBinaryColumn(Alert, compression=compression, compress_threshold=0)
+    for value in (alert_fxt, [alert_fxt], {'a': alert_fxt}, (alert_fxt, alert_fxt)):
+        assert column.process_result_value(column.process_bind_param(value, None), None) == value
+
+
+def test_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        PydanticBinaryColumn(Alert).process_result_value(b'{"message": "x"}', None)
+
+
+def test_rejects_unsupported_type():
+    with pytest.raises(TypeError, match='Unsupported type'):
+        PydanticBinaryColumn(Alert).encode({'message'})
+
+
+def test_lazy_containers_serialize_like_models(test_session, alert_fxt):
+    row = TestModelLazyBinary(alert=alert_fxt, alerts_list=[alert_fxt, alert_fxt], alerts_dict={'a': alert_fxt})
+    expected = row.model_dump(mode='json', exclude={'id'})
+    test_session.add(row)
+    test_session.commit()
+    test_session.expire_all()
+
+    result = test_session.exec(sqa.select(TestModelLazyBinary)).scalar_one()
+    assert type(result.alerts_list) is list
+    assert all(type(_) is LazyJSON and not _.loaded for _ in result.alerts_list)
+    assert type(result.alerts_dict['a']) is LazyJSON
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert json.loads(result.model_dump_json(exclude={'id'})) == expected
+
+    result.alerts_list = [*result.alerts_list, alert_fxt]
+    test_session.commit()
+    test_session.expire_all()
+    assert test_session.get(TestModelLazyBinary, row.id).alerts_list == [alert_fxt] * 3
@@ -0,0 +1,49 @@
+import sqlalchemy as sqa
+
+from pawdantic.pawsql.bulk import bulk_insert
+from pawdantic.pawsql.sqlpr_test import record_queries
+from tests.models import Alert, TestModelNativeJson, TestModelRequiredJson
+
+
+def make_rows(model_class, count, message='bulk'):
+    return [
+        model_class(
+            alert=Alert(code=i, message=message),
+            alerts_list=[Alert(code=i, message=message)],
+            alerts_dict={'a': Alert(code=i, message=message)},
+            alerts_tuple=(),
+        )
+        for i in range(count)
+    ]
+
+
+def test_bulk_insert(test_session):
+    keys = bulk_insert(test_session, TestModelRequiredJson, make_rows(TestModelRequiredJson, 25), batch_size=10)
+    assert sorted(keys) == list(range(1, 26))
+    test_session.commit()
+
+    stored = test_session.exec(sqa.select(TestModelRequiredJson).order_by(TestModelRequiredJson.id)).scalars().all()
+    assert [_.alert.code for _ in stored] == list(range(25))
+    assert stored[3].alerts_dict == {'a': Alert(code=3, message='bulk')}
+
+
+def test_bulk_upsert(test_session):
+    bulk_insert(test_session, TestModelNativeJson, make_rows(TestModelNativeJson, 5))
+    replace = [{'id': 1, **_.model_dump(exclude={'id'})} for _ in make_rows(TestModelNativeJson, 1, 'updated')]
+    replace[0]['alert'] = Alert(message='updated')
+
+    assert bulk_insert(test_session, TestModelNativeJson, replace, on_conflict='ignore') == []
+    assert test_session.get(TestModelNativeJson, 1).alert.message == 'bulk'
+
+    assert bulk_insert(test_session, TestModelNativeJson, replace, on_conflict='update') == [1]
+    test_session.expire_all()
+    assert test_session.get(TestModelNativeJson, 1).alert.message == 'updated'
+    assert test_session.exec(sqa.select(sqa.func.count()).select_from(TestModelNativeJson)).scalar() == 5
+
+
+def test_bulk_insert_is_batched(test_session):
+    with record_queries(test_session.get_bind()) as log:
+        keys = bulk_insert(test_session, TestModelRequiredJson, make_rows(TestModelRequiredJson, 100), batch_size=50)
+        bulk_insert(test_session, TestModelRequiredJson, make_rows(TestModelRequiredJson, 100), return_keys=False)
+    assert sorted(keys) == list(range(1, 101))
+    log.assert_at_most(3)
@@ -0,0 +1,30 @@
+import sqlalchemy as sqa
+
+from pawdantic.pawsql.cache import DecodeCache
+from tests.models import Alert, TestModelCachedJson
+
+
+def test_repeated_values_are_decoded_once(test_session, alert_fxt):
+    for _ in range(5):
+        test_session.add(TestModelCachedJson(alert=alert_fxt, alerts_list=[alert_fxt]))
+    test_session.commit()
+    test_session.expire_all()
+
+    cache: DecodeCache = TestModelCachedJson.__table__.c.alert.type.decode_cache
+    cache.clear()
+    rows = test_session.exec(sqa.select(TestModelCachedJson)).scalars().all()
+    assert cache.info().misses == 1
+    assert cache.info().hits == 4
+    assert all(_.alert == alert_fxt and _.alerts_list == [alert_fxt] for _ in rows)
+
+    rows[0].alert.message = 'changed'
+    rows[0].alerts_list.append(alert_fxt)
+    assert rows[1].alert.message == alert_fxt.message
+    assert rows[1].alerts_list == [alert_fxt]
+
+
+def test_cache_is_bounded():
+    cache = DecodeCache(2)
+    for key in ('a', 'b', 'c', 'a'):
+        cache.get(key, lambda: Alert(message=key))
+    assert cache.info() == (0, 4, 2, 2)
@@ -1,6 +1,8 @@
 import pytest
 
-from tests.models import TestModel, TestModelOptionalJson, TestModelRequiredJson
+from pawdantic.pawsql import PydanticJSONColumn
+from pawdantic.pawsql.codec import container_adapter
+from tests.models import Alert, TestModel, TestModelBinary, TestModelOptionalJson, TestModelRequiredJson
 
 
 @pytest.mark.parametrize(
@@ -10,6 +12,7 @@ from tests.models import TestModel, TestModelOptionalJson, TestModelRequiredJson
         ("test_model_required_json", TestModelRequiredJson),
         ("test_model_optional_json_provided", TestModelOptionalJson),
         ("test_model_optional_json_not_provided", TestModelOptionalJson),
+        ("test_model_binary", TestModelBinary),
     ]
 )
 def test_insert_and_retrieve_model(model_fixture, model_class, request, test_session):
@@ -28,3 +31,28 @@ def test_insert_and_retrieve_model(model_fixture, model_class, request, test_ses
         assert result.alerts_list == test_model_param.alerts_list
         assert result.alerts_dict == test_model_param.alerts_dict
         assert result.alerts_tuple == test_model_param.alerts_tuple
+
+
+def test_container_codec_matches_per_item_encoding(alert_fxt):
+    column = PydanticJSONColumn(Alert)
+    items = [alert_fxt, Alert(message='other', code=2)]
+    dumped = column.process_bind_param(items, None)
+    assert dumped == [_.model_dump_json(round_trip=True) for _ in items]
+    assert column.process_bind_param({'a': alert_fxt}, None) == {'a': alert_fxt.model_dump_json(round_trip=True)}
+    assert column.process_result_value(dumped, None) == items
+
+
+def test_container_codec_keeps_subclass_fields(alert_fxt):
+    class CodedAlert(Alert):
+        source: str = 'test'
+
+    column = PydanticJSONColumn(Alert, native=True)
+    dumped = column.process_bind_param([alert_fxt, CodedAlert(message='sub')], None)
+    assert dumped[1]['source'] == 'test'
+
+
+def test_container_codec_reads_mixed_encodings(alert_fxt):
+    column = PydanticJSONColumn(Alert, native=True)
+    mixed = [alert_fxt.model_dump_json(), alert_fxt.model_dump(mode='json')]
+    assert column.process_result_value(mixed, None) == [alert_fxt, alert_fxt]
+    assert container_adapter(Alert, list) is container_adapter(Alert, list)
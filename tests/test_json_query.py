@@ -0,0 +1,52 @@
+import pytest
+import sqlalchemy as sqa
+
+from pawdantic.pawsql.json_query import json_path
+from tests.models import Alert, AlertType, TestModelNativeJson, TestModelRequiredJson
+
+
+@pytest.fixture
+def stored(test_session):
+    for i, alert_type in enumerate(AlertType):
+        alert = Alert(code=i, message=f'message {i}', type=alert_type)
+        test_session.add(
+            TestModelNativeJson(alert=alert, alerts_list=[alert], alerts_dict={'a': alert}, alerts_tuple=(alert,))
+        )
+    test_session.commit()
+
+
+def test_filter_on_json_fields(test_session, stored):
+    by_type = sqa.select(TestModelNativeJson).where(json_path(TestModelNativeJson.alert).type == AlertType.WARNING)
+    assert [_.alert.type for _ in test_session.exec(by_type).scalars()] == [AlertType.WARNING]
+
+    by_code = sqa.select(TestModelNativeJson).where(json_path(TestModelNativeJson.alerts_list)[0].code > 0)
+    assert len(test_session.exec(by_code).all()) == 2
+
+    by_key = sqa.select(json_path(TestModelNativeJson.alerts_dict)['a'].message).order_by(TestModelNativeJson.id)
+    assert test_session.exec(by_key).scalars().all() == ['message 0', 'message 1', 'message 2']
+
+
+def test_filter_uses_expression_index(test_session, stored):
+    query = sqa.select(TestModelNativeJson.id).where(json_path(TestModelNativeJson.alert).type == AlertType.ERROR)
+    compiled = query.compile(test_session.get_bind(), compile_kwargs={'literal_binds': True})
+    plan = test_session.execute(sqa.text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+    assert 'ix_testmodelnativejson_alert_type' in str(plan)
+
+
+def test_unknown_field_and_legacy_column():
+    with pytest.raises(AttributeError):
+        json_path(TestModelNativeJson.alert).nope
+    with pytest.raises(ValueError):
+        json_path(TestModelRequiredJson.alert)
+
+
+def test_paths_on_one_column_are_cached_apart(test_session, stored):
+    by_type = sqa.select(TestModelNativeJson.id).where(json_path(TestModelNativeJson.alert).type == AlertType.WARNING)
+    assert len(test_session.exec(by_type).all()) == 1
+    by_message = sqa.select(TestModelNativeJson.id).where(json_path(TestModelNativeJson.alert).message == 'message 1')
+    assert len(test_session.exec(by_message).all()) == 1
+
+    messages = sqa.select(json_path(TestModelNativeJson.alert).message).order_by(TestModelNativeJson.id)
+    assert test_session.exec(messages).scalars().all() == ['message 0', 'message 1', 'message 2']
+    types = sqa.select(json_path(TestModelNativeJson.alert).type).order_by(TestModelNativeJson.id)
+    assert test_session.exec(types).scalars().all() == [_.value for _ in AlertType]
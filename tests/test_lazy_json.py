@@ -0,0 +1,60 @@
+import json
+import warnings
+
+import sqlalchemy as sqa
+
+from pawdantic.pawsql.lazy import LazyJSON
+from pawdantic.pawsql.sqlmodel_backup import SQLModelBackup
+from tests.models import Alert, AlertType, TestModelLazyJson
+
+
+def test_lazy_json_loads_on_access(test_session, alert_fxt):
+    test_session.add(TestModelLazyJson(alert=alert_fxt, alerts_list=[alert_fxt, alert_fxt]))
+    test_session.commit()
+    test_session.expire_all()
+
+    result = test_session.exec(sqa.select(TestModelLazyJson)).scalar_one()
+    assert type(result.alert) is LazyJSON
+    assert repr(result.alert) == 'LazyJSON(<not loaded>)'
+    assert not result.alert.loaded
+    assert result.alert.type == AlertType.WARNING
+    assert result.alert.loaded
+    assert result.alert == alert_fxt
+    assert result.alerts_list == [alert_fxt, alert_fxt]
+    assert len(result.alerts_list) == 2
+    assert result.alerts_list[0] == alert_fxt
+    assert result.alert.model_dump_json() == alert_fxt.model_dump_json()
+
+
+def test_lazy_json_writes_back(test_session, alert_fxt):
+    test_session.add(TestModelLazyJson(alert=alert_fxt, alerts_list=[alert_fxt]))
+    test_session.commit()
+    test_session.expire_all()
+
+    result = test_session.exec(sqa.select(TestModelLazyJson)).scalar_one()
+    result.alerts_list = result.alerts_list
+    result.alert = Alert(message='changed')
+    test_session.commit()
+    test_session.expire_all()
+
+    result = test_session.exec(sqa.select(TestModelLazyJson)).scalar_one()
+    assert result.alert.message == 'changed'
+    assert result.alerts_list == [alert_fxt]
+
+
+def test_lazy_json_serializes_like_model(test_session, alert_fxt, tmp_path):
+    test_session.add(TestModelLazyJson(alert=alert_fxt, alerts_list=[alert_fxt]))
+    test_session.commit()
+    test_session.expire_all()
+
+    result = test_session.exec(sqa.select(TestModelLazyJson)).scalar_one()
+    assert isinstance(result.alert, Alert)
+    assert isinstance(result.alerts_list, list)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        dumped = result.model_dump()
+        assert json.loads(result.model_dump_json())['alert'] == alert_fxt.model_dump(mode='json')
+    assert dumped['alerts_list'] == [alert_fxt.model_dump()]
+
+    backup = SQLModelBackup(test_session, [TestModelLazyJson], tmp_path)
+    assert sum(backup.backup().values()) == 1
@@ -0,0 +1,108 @@
+import pytest
+import sqlalchemy as sqa
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from pawdantic.pawsql.mutable import listen_for_flushes, skip_unchanged
+from tests.models import Alert, AlertType, TestModelMutableJson
+
+
+@pytest.fixture
+def stored(test_session, alert_fxt):
+    test_session.add(
+        TestModelMutableJson(
+            alert=alert_fxt,
+            alerts_list=[alert_fxt],
+            alerts_dict={'alert1': alert_fxt},
+            alerts_tuple=(alert_fxt,),
+        )
+    )
+    test_session.commit()
+    test_session.expire_all()
+    return test_session.exec(sqa.select(TestModelMutableJson)).scalar_one()
+
+
+@pytest.fixture
+def updates(test_session):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE'):
+            statements.append(statement)
+
+    event.listen(test_session.get_bind(), 'before_cursor_execute', record)
+    yield statements
+    event.remove(test_session.get_bind(), 'before_cursor_execute', record)
+
+
+def reload(session) -> TestModelMutableJson:
+    session.commit()
+    session.expire_all()
+    return session.exec(sqa.select(TestModelMutableJson)).scalar_one()
+
+
+def test_in_place_changes_are_saved(test_session, stored):
+    stored.alert.message = 'model'
+    stored.alerts_list.append(Alert(message='appended'))
+    stored.alerts_dict['alert1'].type = AlertType.ERROR
+    stored.alerts_tuple[0].code = 7
+
+    result = reload(test_session)
+    assert result.alert.message == 'model'
+    assert result.alerts_list[-1].message == 'appended'
+    assert result.alerts_dict['alert1'].type == AlertType.ERROR
+    assert result.alerts_tuple[0].code == 7
+
+
+def test_assigned_values_are_tracked(test_session, stored):
+    stored.alert = Alert(message='assigned')
+    stored.alerts_list = [Alert(message='assigned')]
+    test_session.flush()
+
+    stored.alert.message = 'model'
+    stored.alerts_list[0].message = 'list'
+    assert stored in test_session.dirty
+    result = reload(test_session)
+    assert result.alert.message == 'model'
+    assert result.alerts_list[0].message == 'list'
+
+
+def test_added_items_are_tracked(test_session, stored):
+    stored.alerts_list.append(Alert(message='appended'))
+    stored.alerts_list[0] = Alert(message='set')
+    stored.alerts_dict['alert2'] = Alert(message='set')
+    test_session.flush()
+
+    stored.alerts_list[-1].message = 'appended changed'
+    stored.alerts_list[0].message = 'set changed'
+    stored.alerts_dict['alert2'].message = 'set changed'
+    assert stored in test_session.dirty
+    result = reload(test_session)
+    assert [_.message for _ in result.alerts_list] == ['set changed', 'appended changed']
+    assert result.alerts_dict['alert2'].message == 'set changed'
+
+
+def test_unchanged_values_are_not_written(test_session, stored, alert_fxt, updates):
+    stored.alert.message = 'changed'
+    stored.alert.message = alert_fxt.message
+    stored.alerts_list = [Alert(**alert_fxt.model_dump())]
+    stored.alerts_dict['alert1'].code = None
+    test_session.commit()
+    assert updates == []
+
+    stored = reload(test_session)
+    stored.alert.message = 'changed'
+    test_session.flush()
+    stored.alert.message = alert_fxt.message
+    test_session.commit()
+    assert len(updates) == 2
+    assert reload(test_session).alert == alert_fxt
+
+
+def test_flush_listener_registered_once():
+    # registered by the mutable columns of tests.models, removing it once leaves none
+    assert event.contains(Session, 'before_flush', skip_unchanged)
+    listen_for_flushes()
+    event.remove(Session, 'before_flush', skip_unchanged)
+    assert not event.contains(Session, 'before_flush', skip_unchanged)
+    listen_for_flushes()
@@ -0,0 +1,69 @@
+from collections.abc import Sequence
+
+import pytest
+import sqlalchemy as sqa
+
+from pawdantic.pawsql import PydanticJSONColumn, declared_container
+from pawdantic.pawsql.migrations import migrate_to_native
+from tests.models import Alert, AlertType, TestModelNativeJson
+
+
+def test_native_stored_once(test_session, test_model_native_json):
+    test_session.add(test_model_native_json)
+    test_session.commit()
+    raw = test_session.execute(sqa.text('SELECT alert, alerts_dict FROM testmodelnativejson')).one()
+    assert raw.alert.startswith('{"code"')
+    assert '\\"' not in raw.alert
+    assert '\\"' not in raw.alerts_dict
+
+    test_session.expire_all()
+    result = test_session.get(TestModelNativeJson, test_model_native_json.id)
+    assert result.alert == test_model_native_json.alert
+    assert result.alerts_list == test_model_native_json.alerts_list
+    assert result.alerts_dict == test_model_native_json.alerts_dict
+    assert result.alerts_tuple == list(test_model_native_json.alerts_tuple)
+
+
+@pytest.mark.parametrize('keys', [['key'], ['message'], ['message', 'code'], []])
+def test_dict_keyed_by_field_names_is_read_as_dict(test_session, keys):
+    alert = Alert(message='Test message', type=AlertType.ERROR)
+    alerts_dict = {key: Alert(message=key) for key in keys}
+    test_session.add(TestModelNativeJson(alert=alert, alerts_list=[], alerts_dict=alerts_dict, alerts_tuple=()))
+    test_session.commit()
+    test_session.expire_all()
+    result = test_session.exec(sqa.select(TestModelNativeJson)).scalar_one()
+    assert result.alert == alert
+    assert result.alerts_dict == alerts_dict
+
+
+def test_declared_container():
+    assert declared_container(Alert) is None
+    assert declared_container(Alert | None) is None
+    assert declared_container(dict[str, Alert] | None) is dict
+    assert declared_container(tuple[Alert, ...]) is tuple
+    assert declared_container(Sequence[Alert]) is list
+    assert PydanticJSONColumn(Alert, native=True, container=dict).stores_dict()
+
+
+def test_migrate_to_native(test_session, test_model_required_json):
+    test_session.add(test_model_required_json)
+    test_session.commit()
+    copy_legacy = sqa.text(
+        'INSERT INTO testmodelnativejson '
+        'SELECT id, alert, alerts_list, alerts_dict, alerts_tuple FROM testmodelrequiredjson'
+    )
+    test_session.execute(copy_legacy)
+    test_session.commit()
+
+    legacy = test_session.get(TestModelNativeJson, test_model_required_json.id)
+    assert legacy.alert == test_model_required_json.alert
+    test_session.expire_all()
+
+    assert migrate_to_native(test_session, TestModelNativeJson, batch_size=1) == 1
+    assert migrate_to_native(test_session, TestModelNativeJson) == 0
+    raw = test_session.execute(sqa.text('SELECT alert FROM testmodelnativejson')).scalar_one()
+    assert '\\"' not in raw
+
+    result = test_session.get(TestModelNativeJson, test_model_required_json.id)
+    assert result.alert == test_model_required_json.alert
+    assert result.alerts_dict == test_model_required_json.alerts_dict
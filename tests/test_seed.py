@@ -0,0 +1,33 @@
+import pytest
+import sqlalchemy as sqa
+
+from pawdantic.pawsql.seed import fake_value
+from tests.models import Alert, AlertType, Hero, HeroPowerLink, Power, Team, TestModelRequiredJson
+
+
+@pytest.fixture(scope='session')
+def template_counts_fxt():
+    return {Team: 5, Hero: 50, Power: 4, HeroPowerLink: 20, TestModelRequiredJson: 1000}
+
+
+def test_fake_value():
+    assert fake_value(Alert, 3) == Alert(code=3, message='3', type=list(AlertType)[0])
+    assert fake_value(tuple[Alert, ...], 1) == (fake_value(Alert, 1),)
+    assert fake_value(dict[str, int] | None, 2) == {'2': 2}
+
+
+def test_template_is_seeded(template_session_fxt):
+    session = template_session_fxt
+    assert session.exec(sqa.select(sqa.func.count()).select_from(TestModelRequiredJson)).scalar() == 1000
+    row = session.get(TestModelRequiredJson, 10)
+    assert row.alert == fake_value(Alert, 9)
+    assert session.get(Hero, 7).team is not None
+    assert len(session.exec(sqa.select(HeroPowerLink)).all()) == 20
+
+
+def test_copies_are_independent(template_db_fxt):
+    first, second = template_db_fxt.copy(), template_db_fxt.copy()
+    with first.begin() as connection:
+        connection.execute(sqa.delete(TestModelRequiredJson.__table__))
+    with second.connect() as connection:
+        assert connection.execute(sqa.select(sqa.func.count()).select_from(TestModelRequiredJson)).scalar() == 1000
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sqa
+from sqlmodel import SQLModel, Session
+
+from pawdantic.pawsql.sqlpr import (
+    RelationshipRegistry,
+    assign_all,
+    get_other_table_names,
+    link_all,
+    model_map_,
+    related_from_snakenames,
+    select_related,
+)
+from pawdantic.pawsql.sqlpr_test import query_shape, record_queries
+from tests.models import Hero, HeroPowerLink, Power, Team
+
+
+def test_registry_maps_pairs_to_relationships():
+    registry = RelationshipRegistry([Hero, Team])
+    assert registry.relationship(Hero, Power).key == 'powers'
+    assert registry.relationship(Hero, Team).key == 'team'
+    assert registry.relationship(Team, Hero).key == 'heroes'
+    with pytest.raises(KeyError):
+        registry.relationship(Team, Power)
+
+
+def test_related_objects():
+    flight = Power(name='flight')
+    hero = Hero(name='hero', powers=[flight])
+    assert related_from_snakenames(hero, Power) == [flight]
+    assert get_other_table_names(hero, [Hero, Power]) == [[flight]]
+    assert get_other_table_names(hero, (Power,)) == [[flight]]
+
+
+def test_assign_all():
+    hero = Hero(name='hero')
+    powers = [Power(name='flight'), Power(name='speed')]
+    asyncio.run(assign_all(hero, {'powers': powers, 'teams': []}))
+    assert hero.powers == powers
+
+
+@pytest.fixture
+def linked_session(engine_fxt):
+    SQLModel.metadata.create_all(engine_fxt)
+    with Session(engine_fxt) as session:
+        team = Team(name='team')
+        hero = Hero(name='hero', powers=[Power(name='existing')])
+        session.add_all([team, hero])
+        session.commit()
+        yield session, hero, team
+
+
+def test_link_all_many_to_many(linked_session):
+    session, hero, team = linked_session
+    existing = hero.powers[0]
+    new = [Power(name=f'power {i}') for i in range(5)]
+    session.add_all(new)
+
+    assert link_all(session, hero, {'powers': [existing, *new, new[0]]}, batch_size=2, commit=True) == 5
+    assert sorted(_.name for _ in hero.powers) == ['existing'] + [f'power {i}' for i in range(5)]
+    assert new[0].heroes == [hero]
+    assert len(session.exec(sqa.select(HeroPowerLink)).all()) == 6
+
+
+def test_link_all_adds_unsaved_matches(linked_session):
+    session, hero, team = linked_session
+    unsaved = [Power(name='unsaved')]
+    assert link_all(session, hero, {'powers': unsaved}, commit=True) == 1
+    assert sorted(_.name for _ in hero.powers) == ['existing', 'unsaved']
+    assert sqa.inspect(unsaved[0]).persistent
+
+
+def test_link_all_one_to_many(linked_session):
+    session, hero, team = linked_session
+    assert team.heroes == []
+    asyncio.run(assign_all(team, {'heroes': [hero]}, session=session, in_thread=True))
+    assert team.heroes == [hero]
+    assert hero.team_id == team.id
+
+
+def test_select_related_uses_fixed_queries(engine_fxt):
+    SQLModel.metadata.create_all(engine_fxt)
+    with Session(engine_fxt) as session:
+        powers = [Power(name='flight'), Power(name='speed')]
+        session.add_all(Hero(name=f'hero {i}', team=Team(name=f'team {i}'), powers=powers) for i in range(20))
+        session.commit()
+
+    with Session(engine_fxt) as session, record_queries(engine_fxt) as log:
+        heroes = session.exec(select_related(Hero, [Hero, Team, Power])).unique().all()
+        assert len(heroes) == 20
+        assert all(len(hero.powers) == 2 and hero.team.name for hero in heroes)
+    log.assert_at_most(2)
+    log.assert_no_repeats()
+
+    with Session(engine_fxt) as session, record_queries(engine_fxt) as log:
+        assert all(hero.team.name for hero in session.exec(sqa.select(Hero)).scalars())
+    assert log.repeated(threshold=20)
+
+
+def test_query_shape():
+    assert query_shape('SELECT a FROM t WHERE id IN (?, ?, ?)') == query_shape('SELECT a FROM t WHERE id IN (?)')
+    assert query_shape("SELECT a FROM t WHERE id = 12 AND b = 'x'") == 'SELECT a FROM t WHERE id = ? AND b = ?'
+
+
+def test_link_all_query_count(engine_fxt, query_log_fxt):
+    SQLModel.metadata.create_all(engine_fxt)
+    with Session(engine_fxt) as session:
+        hero = Hero(name='hero')
+        powers = [Power(name=f'power {i}') for i in range(100)]
+        session.add_all([hero, *powers])
+        session.commit()
+        query_log_fxt.clear()
+
+        link_all(session, hero, {'powers': powers}, batch_size=50)
+    query_log_fxt.assert_at_most(10)
+
+
+def test_model_map_from_relationships():
+    assert model_map_([Team, Power, Hero], source=Hero) == {'team': Team, 'powers': Power}
+    assert model_map_([Team, Power]) == {'teams': Team, 'powers': Power}
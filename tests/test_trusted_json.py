@@ -0,0 +1,59 @@
+from datetime import datetime
+
+from pydantic import BaseModel, field_validator
+
+from pawdantic.pawsql import PydanticJSONColumn
+from pawdantic.pawsql.trusted import construct, trusted_reads
+from tests.models import Alert, AlertType
+
+
+class Incident(BaseModel):
+    name: str
+    raised: datetime
+    alerts: tuple[Alert, ...] = ()
+    by_type: dict[AlertType, Alert] = {}
+    parent: Alert | None = None
+    tags: set[str] = set()
+
+    @field_validator('name')
+    @classmethod
+    def no_validation(cls, v):
+        raise AssertionError('Trusted reads must not validate')
+
+
+def incident_json(alert: Alert) -> dict:
+    incident = Incident.model_construct(
+        name='outage',
+        raised=datetime(2024, 1, 1, 12),
+        alerts=(alert, alert),
+        by_type={AlertType.WARNING: alert},
+        tags={'db'},
+    )
+    return incident.model_dump(mode='json', round_trip=True)
+
+
+def test_construct_nested(alert_fxt):
+    incident = construct(Incident, incident_json(alert_fxt))
+    assert incident.raised == datetime(2024, 1, 1, 12)
+    assert incident.alerts == (alert_fxt, alert_fxt)
+    assert incident.by_type == {AlertType.WARNING: alert_fxt}
+    assert type(next(iter(incident.by_type))) is AlertType
+    assert incident.alerts[0].type is AlertType.WARNING
+    assert incident.parent is None
+    assert incident.tags == {'db'}
+    assert incident.model_fields_set == set(Incident.model_fields)
+
+
+def test_trusted_column(alert_fxt):
+    column = PydanticJSONColumn(Alert, native=True, trusted=True)
+    stored = column.process_bind_param([alert_fxt], None)
+    assert column.process_result_value(stored, None) == [alert_fxt]
+
+    incidents = PydanticJSONColumn(Incident, native=True, trusted=True)
+    assert incidents.process_result_value(incident_json(alert_fxt), None).name == 'outage'
+
+
+def test_trusted_reads_override(alert_fxt):
+    column = PydanticJSONColumn(Incident, native=True)
+    with trusted_reads():
+        assert column.process_result_value(incident_json(alert_fxt), None).name == 'outage'